@@ -4,17 +4,22 @@ Define an `Obfuscator` base class and subclasses that uses different obfuscation
  techniques.
 
 """
-from typing import List
+from typing import Any, List, Optional, Tuple
 
+from obfuscator.cache import ObfuscationCache, fingerprint
+from obfuscator.editbuffer import EditBuffer
 from obfuscator.techniques import (
     PassthroughTechnique,
     RemoveSpacesTechnique,
-    ReplaceAdditionTechnique,
+    ReplaceAdditionChainTechnique,
+    ReplaceSingleAdditionConstantTechnique,
     ReplaceSingleAdditionTechnique,
     ReplaceXORTechnique,
     Technique,
 )
 
+__version__ = "0.1.0"
+
 
 class Obfuscator:
     """Base class for an obfuscator.
@@ -24,15 +29,40 @@ class Obfuscator:
 
     Attributes:
         techniques (List[`Technique`]): List of `Technique` that implement an
-        `apply(str)->str` method.
+        `apply(str)->str` and an `edit(EditBuffer)->int` methods.
+        cache (Optional[`ObfuscationCache`]): results cache, None to
+        always run the techniques.
+        seed (int): seed of the randomized techniques. The output only depends
+        on the source code, the techniques and the seed.
 
     """
 
-    def __init__(self, techniques: List[Technique]):
+    def __init__(
+        self,
+        techniques: List[Technique],
+        cache: Optional[ObfuscationCache] = None,
+        seed: int = 0,
+    ):
         self.techniques = techniques
+        self.cache = cache
+        self.seed = seed
+
+    def fingerprint(self) -> str:
+        """Fingerprint of the obfuscation, used as part of the cache key.
+
+        Returns:
+            str: hex digest
+        """
+        return fingerprint(self.techniques, __version__, *self._parameters())
+
+    def _parameters(self) -> List[Any]:
+        """Parameters of the obfuscation other than the techniques."""
+        return [type(self).__qualname__, self.seed]
 
     def obfuscate(self, source_code: str) -> str:
         """Obfuscate code using the the techniques indicated at instanciation.
+        When the obfuscator has a cache, a previous result for the same source
+        code and fingerprint is returned without running any technique.
 
         Args:
             source_code (str): source code to obfuscate
@@ -40,17 +70,66 @@ class Obfuscator:
         Returns:
             str: obfuscated source code
         """
+        if self.cache is None:
+            return self._obfuscate(source_code)
+        key = self.cache.key(source_code, self.fingerprint())
+        obfuscated = self.cache.get(key)
+        if obfuscated is None:
+            obfuscated = self._obfuscate(source_code)
+            self.cache.put(key, obfuscated)
+        return obfuscated
+
+    def _obfuscate(self, source_code: str) -> str:
+        buffer = EditBuffer(source_code, seed=self.seed)
+        self.edit(buffer)
+        return buffer.text()
+
+    def edit(self, buffer: EditBuffer) -> None:
+        """Apply the techniques, in order, to the buffer.
+
+        Args:
+            buffer (EditBuffer): source code buffer
+        """
         for technique in self.techniques:
-            source_code = technique.apply(source_code)
-        return source_code
+            technique.edit(buffer)
+
+    def stages(self) -> List[Tuple["Obfuscator", bool]]:
+        """Split the obfuscation into stages, for `ParallelObfuscator`.
+
+        A stage is chunk safe when all its techniques are `CHUNK_SAFE`: it can
+        then be applied separately to each top-level function, the includes
+        it requests being inserted once the chunks are reassembled. A stage
+        ends after each technique inserting LIBS so that the next techniques
+        see the includes, as in a sequential run.
+
+        Returns:
+            List[Tuple[Obfuscator, bool]]: (stage, chunk safe) in order.
+        """
+        stages: List[Tuple[Obfuscator, bool]] = []
+        techniques: List[Technique] = []
+        for technique in self.techniques:
+            chunk_safe = getattr(technique, "CHUNK_SAFE", False)
+            if techniques and not chunk_safe:
+                stages.append((Obfuscator(techniques, seed=self.seed), True))
+                techniques = []
+            if not chunk_safe:
+                stages.append((Obfuscator([technique], seed=self.seed), False))
+                continue
+            techniques.append(technique)
+            if getattr(technique, "LIBS", ()):
+                stages.append((Obfuscator(techniques, seed=self.seed), True))
+                techniques = []
+        if techniques:
+            stages.append((Obfuscator(techniques, seed=self.seed), True))
+        return stages
 
 
 class PassthroughObfuscator(Obfuscator):
     """Simple passthrough obfuscator: the obfuscated code will be the same as
     the input source code"""
 
-    def __init__(self):
-        super().__init__([PassthroughTechnique])
+    def __init__(self, cache: Optional[ObfuscationCache] = None, seed: int = 0):
+        super().__init__([PassthroughTechnique], cache, seed)
 
 
 class HarderToRead(Obfuscator):
@@ -58,8 +137,26 @@ class HarderToRead(Obfuscator):
     will make source code harder to read.
     """
 
-    def __init__(self):
-        super().__init__([RemoveSpacesTechnique])
+    def __init__(self, cache: Optional[ObfuscationCache] = None, seed: int = 0):
+        super().__init__([RemoveSpacesTechnique], cache, seed)
+
+
+class ConstantReplacementObfuscator(Obfuscator):
+    """Uses the substitution techniques of `ReplacementObfuscator`, but single
+    additions are replaced using constants chosen at obfuscation time instead
+    of calling `rand()`: the generated code has no call and needs no lib.
+    """
+
+    def __init__(self, cache: Optional[ObfuscationCache] = None, seed: int = 0):
+        super().__init__(
+            [
+                ReplaceSingleAdditionConstantTechnique,
+                ReplaceAdditionChainTechnique,
+                ReplaceXORTechnique,
+            ],
+            cache,
+            seed,
+        )
 
 
 class ReplacementObfuscator(Obfuscator):
@@ -69,11 +166,13 @@ class ReplacementObfuscator(Obfuscator):
     See: https://github.com/obfuscator-llvm/obfuscator/wiki/Instructions-Substitution
     """
 
-    def __init__(self):
+    def __init__(self, cache: Optional[ObfuscationCache] = None, seed: int = 0):
         super().__init__(
             [
-                ReplaceAdditionTechnique,
+                ReplaceAdditionChainTechnique,
                 ReplaceSingleAdditionTechnique,
                 ReplaceXORTechnique,
-            ]
+            ],
+            cache,
+            seed,
         )
@@ -0,0 +1,142 @@
+"""Batch obfuscation of a stream of source records.
+
+Integrations such as editors or build scripts keep a single process open and
+stream their sources through it, instead of starting one process per file:
+source records are read from a binary stream (ex: stdin) and only the
+obfuscated records are written to the output stream (ex: stdout), in the same
+order and format. Two record formats are supported:
+
+* `nul`: each record is terminated by a NUL byte (the last terminator can be
+  omitted).
+* `length`: each record is preceded by its length in bytes, in decimal, and a
+  newline (ex: `b"12\\nres = a + b;"`).
+
+Records are decoded as UTF-8, bytes that are not valid UTF-8 being written back
+unchanged. With several workers, records are obfuscated in a pool of worker
+processes while the next ones are read, and each result is written as soon as
+it and the previous ones are ready.
+
+"""
+
+import functools
+import multiprocessing
+from enum import Enum
+from typing import BinaryIO, Callable, Iterator, Optional
+
+READ_SIZE = 64 * 1024
+ENCODING = "utf-8"
+ENCODING_ERRORS = "surrogateescape"
+
+
+class RecordError(ValueError):
+    """Raised when the input stream is not a valid record stream."""
+
+
+class RecordFormat(str, Enum):
+    """Delimitation of the records of a stream."""
+
+    NUL = "nul"
+    LENGTH = "length"
+
+
+def read_records(stream: BinaryIO, record_format: RecordFormat) -> Iterator[bytes]:
+    """Iterate over the records of a stream, as soon as they are complete.
+
+    Args:
+        stream (BinaryIO): input stream
+        record_format (RecordFormat): delimitation of the records
+
+    Raises:
+        RecordError: if a record length is invalid or a record is truncated
+
+    Returns:
+        Iterator[bytes]: records, in order
+    """
+    if record_format == RecordFormat.LENGTH:
+        while header := stream.readline():
+            try:
+                length = int(header)
+            except ValueError:
+                raise RecordError(f"Invalid record length ({header!r})") from None
+            if length < 0:
+                raise RecordError(f"Invalid record length ({header!r})")
+            record = stream.read(length)
+            if len(record) < length:
+                raise RecordError(
+                    f"Truncated record: expected ({length}) bytes, got ({len(record)})"
+                )
+            yield record
+        return
+    # read1 returns the available bytes without waiting for READ_SIZE bytes
+    read = getattr(stream, "read1", stream.read)
+    parts = []
+    while chunk := read(READ_SIZE):
+        *records, rest = chunk.split(b"\0")
+        for record in records:
+            parts.append(record)
+            yield b"".join(parts)
+            parts = []
+        parts.append(rest)
+    if any(parts):
+        yield b"".join(parts)
+
+
+def write_record(stream: BinaryIO, record: bytes, record_format: RecordFormat) -> None:
+    """Write a record to a stream and flush it.
+
+    Args:
+        stream (BinaryIO): output stream
+        record (bytes): record
+        record_format (RecordFormat): delimitation of the records
+    """
+    if record_format == RecordFormat.LENGTH:
+        stream.write(b"%d\n" % len(record) + record)
+    else:
+        stream.write(record + b"\0")
+    stream.flush()
+
+
+def _obfuscate_record(obfuscate: Callable[[str], str], record: bytes) -> bytes:
+    source_code = record.decode(ENCODING, ENCODING_ERRORS)
+    return obfuscate(source_code).encode(ENCODING, ENCODING_ERRORS)
+
+
+def obfuscate_stream(
+    obfuscate: Callable[[str], str],
+    input_stream: BinaryIO,
+    output_stream: BinaryIO,
+    record_format: RecordFormat,
+    workers: Optional[int] = None,
+) -> int:
+    """Obfuscate each record of the input stream and write the results to the
+    output stream, in order.
+
+    Args:
+        obfuscate (Callable[[str], str]): obfuscation of a source code (ex:
+        `Obfuscator.obfuscate`), must be picklable with several workers.
+        input_stream (BinaryIO): stream of source records
+        output_stream (BinaryIO): stream the obfuscated records are written to
+        record_format (RecordFormat): delimitation of the records, in both
+        streams
+        workers (Optional[int], optional): number of worker processes. Defaults
+        to None (records are obfuscated in the current process).
+
+    Raises:
+        RecordError: if the input stream is not a valid record stream
+
+    Returns:
+        int: number of records
+    """
+    records = read_records(input_stream, record_format)
+    function = functools.partial(_obfuscate_record, obfuscate)
+    count = 0
+    if workers is None or workers <= 1:
+        for result in map(function, records):
+            write_record(output_stream, result, record_format)
+            count += 1
+        return count
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        for result in pool.imap(function, records):
+            write_record(output_stream, result, record_format)
+            count += 1
+    return count
@@ -0,0 +1,153 @@
+"""Benchmarks guarding against performance regressions.
+
+Run them with `python -m obfuscator.benchmarks` (or `make bench`).
+
+"""
+
+import pathlib
+import re
+import tempfile
+import time
+from typing import Any, Callable, Dict, NamedTuple, Tuple
+
+from obfuscator import ctools
+from obfuscator.techniques import (
+    PassthroughTechnique,
+    ReplaceSingleAdditionConstantTechnique,
+    ReplaceSingleAdditionTechnique,
+)
+
+# Inputs known to make backtracking regexes stall, generated for a given size.
+ADVERSARIAL_SIGNATURE_INPUTS: Dict[str, Callable[[int], str]] = {
+    "long_identifier_line": lambda size: " ".join(["a"] * size) + "(",
+    "unbalanced_parenthesis": lambda size: "int f(" + "a, " * size,
+    "nested_parentheses": lambda size: "int f" + "(" * size + ")" * size + "{}",
+    "pointer_run": lambda size: "int " + "*" * size + " f(int a",
+    "many_functions": lambda size: "int f(int a){return a;}\n" * size,
+    "multiline_parameters": lambda size: "int f(" + "int a,\n" * size + "int b){}",
+}
+
+# Hot loop whose single addition is obfuscated, and the compared techniques.
+SINGLE_ADDITION_KERNEL = r"""#include <stdint.h>
+
+uint32_t kernel(uint32_t n)
+{
+    uint32_t i, a, b, r;
+    a = 0;
+    for (i = 0; i < n; i++) {
+        b = a + i;
+        a = b ^ i;
+    }
+    return a;
+}
+"""
+SINGLE_ADDITION_TECHNIQUES = {
+    "original": PassthroughTechnique,
+    "rand": ReplaceSingleAdditionTechnique,
+    "constant": ReplaceSingleAdditionConstantTechnique,
+}
+RAND_CALL_PATTERN = re.compile(r"\brand\s*\(")
+
+
+class BenchmarkResult(NamedTuple):
+    """Result of a benchmark run.
+
+    Attributes:
+        duration (float): wall time, in seconds. Only meaningful on an idle
+        machine, tests check `count` instead.
+        count (int): deterministic amount of work done by the run (ex: number
+        of signatures found), to check the run did what was timed.
+    """
+
+    duration: float
+    count: int
+
+
+def _time(function: Callable, *args) -> Tuple[float, Any]:
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def benchmark_signature_extraction(size: int = 10000) -> Dict[str, BenchmarkResult]:
+    """Time the function signature extraction on adversarial inputs.
+
+    Args:
+        size (int, optional): size parameter of the generated inputs.
+        Defaults to 10000.
+
+    Returns:
+        Dict[str, BenchmarkResult]: duration and number of signatures found,
+        per input.
+    """
+    results = {}
+    for name, generate in ADVERSARIAL_SIGNATURE_INPUTS.items():
+        duration, signatures = _time(ctools.get_function_signatures, generate(size))
+        results[name] = BenchmarkResult(duration, len(signatures))
+    return results
+
+
+def benchmark_single_addition(
+    tmpdir: pathlib.Path, iterations: int = 10**7, repeat: int = 3
+) -> Dict[str, BenchmarkResult]:
+    """Time a hot loop obfuscated by each of the single addition techniques,
+    compiled with `ctools.Runner`.
+
+    Args:
+        tmpdir (pathlib.Path): directory of the build artifacts
+        iterations (int, optional): loop iterations. Defaults to 10**7.
+        repeat (int, optional): runs per technique, the fastest one is kept.
+        Defaults to 3.
+
+    Raises:
+        ValueError: if the obfuscated loops do not compute the original result
+
+    Returns:
+        Dict[str, BenchmarkResult]: duration and number of `rand` calls in the
+        obfuscated loop, per technique.
+    """
+    runner = ctools.Runner(tmpdir)
+    modules = {name: f"single_addition_{name}" for name in SINGLE_ADDITION_TECHNIQUES}
+    sources = {
+        name: technique.apply(SINGLE_ADDITION_KERNEL)
+        for name, technique in SINGLE_ADDITION_TECHNIQUES.items()
+    }
+    runner.compile_sources({modules[name]: sources[name] for name in modules})
+    results = {
+        name: runner.run(module, "kernel", iterations)
+        for name, module in modules.items()
+    }
+    if len(set(results.values())) > 1:
+        raise ValueError(f"Obfuscated kernels results differ: ({results})")
+    return {
+        name: BenchmarkResult(
+            min(
+                _time(runner.run, module, "kernel", iterations)[0]
+                for _ in range(repeat)
+            ),
+            len(RAND_CALL_PATTERN.findall(sources[name])),
+        )
+        for name, module in modules.items()
+    }
+
+
+def main() -> None:  # pragma: no cover
+    """Run all benchmarks and print the results."""
+    for size in (1000, 10000, 100000):
+        for name, result in benchmark_signature_extraction(size).items():
+            print(
+                f"signatures {name:<24} size {size:>6}:"
+                f" {result.duration * 1000:8.1f} ms ({result.count} found)"
+            )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = benchmark_single_addition(pathlib.Path(tmpdir))
+    for name, result in results.items():
+        ratio = result.duration / results["original"].duration
+        print(
+            f"single addition {name:<19}: {result.duration * 1000:8.1f} ms"
+            f" ({ratio:.2f}x, {result.count} rand calls)"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pragma: no cover
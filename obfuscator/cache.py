@@ -0,0 +1,196 @@
+"""Memoization of obfuscation results.
+
+Results are keyed by the hash of the source code and a fingerprint of the
+obfuscation (technique classes, their parameters such as PATTERN and
+REPLACEMENT, and the package version passed by the caller), so that an
+identical input returns its previous output without running any technique.
+Results are kept in memory (LRU) and, optionally, on disk in a directory whose
+total size is capped.
+
+"""
+
+import hashlib
+import os
+import pathlib
+import tempfile
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+# Prefix of the files being written, never evicted: another process may be
+# about to rename them.
+TEMP_PREFIX = ".tmp-"
+# Number of disk writes after which the directory size is measured again, to
+# account for the writes of other processes sharing the directory.
+EVICT_INTERVAL = 32
+
+
+def _parameters(technique: Any) -> str:
+    """Collect the upper case class attributes (PATTERN, REPLACEMENT, COST...)
+    of a technique and its bases."""
+    parameters = {}
+    for klass in reversed(getattr(technique, "__mro__", [type(technique)])):
+        for name, value in vars(klass).items():
+            if name.isupper() and not callable(value):
+                parameters[name] = value
+    return repr(sorted(parameters.items()))
+
+
+def fingerprint(techniques: Iterable[Any], *extra: Any) -> str:
+    """Fingerprint a technique chain.
+
+    Args:
+        techniques (Iterable[Any]): techniques, in order
+        extra (Any): other parameters of the obfuscation (ex: package version,
+        planner budget)
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha256()
+    for technique in techniques:
+        digest.update(f"{technique.__module__}.{technique.__qualname__}".encode())
+        digest.update(_parameters(technique).encode())
+    digest.update(repr(extra).encode())
+    return digest.hexdigest()
+
+
+class ObfuscationCache:
+    """In memory LRU cache of obfuscation results, optionally backed by a
+    directory.
+
+    Attributes:
+        maxsize (int): maximum number of results kept in memory
+        directory (Optional[pathlib.Path]): directory storing results on disk
+        max_bytes (int): maximum total size of the results stored on disk
+        hits (int): lookups answered from memory or disk
+        disk_hits (int): lookups answered from disk
+        misses (int): lookups not answered
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        directory: Optional[pathlib.Path] = None,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        # Estimated size of the directory, None until measured
+        self._disk_bytes: Optional[int] = None
+        self._writes = 0
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits} hit(s) ({self.disk_hits} from disk), "
+            f"{self.misses} miss(es)"
+        )
+
+    @staticmethod
+    def key(source_code: str, chain_fingerprint: str) -> str:
+        """Cache key of a source code obfuscated by a technique chain.
+
+        Args:
+            source_code (str): source code
+            chain_fingerprint (str): see `fingerprint`
+
+        Returns:
+            str: hex digest
+        """
+        digest = hashlib.sha256(chain_fingerprint.encode())
+        digest.update(source_code.encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a result, from memory first then from disk.
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            Optional[str]: obfuscated source code, None if not cached.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key]
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                value = path.read_text()
+                os.utime(path)
+            except OSError:
+                pass
+            else:
+                self._remember(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        """Store a result in memory, and on disk if a directory is set.
+
+        Args:
+            key (str): cache key
+            value (str): obfuscated source code
+        """
+        self._remember(key, value)
+        if self.directory is not None:
+            path = self._path(key)
+            path.parent.mkdir(exist_ok=True)
+            # Atomic write, several processes may share the directory
+            with tempfile.NamedTemporaryFile(
+                "w", dir=path.parent, prefix=TEMP_PREFIX, delete=False
+            ) as temp_file:
+                temp_file.write(value)
+            try:
+                os.replace(temp_file.name, path)
+            except FileNotFoundError:
+                # The shard directory was removed meanwhile, skip the disk
+                return
+            self._writes += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes += path.stat().st_size
+            if (
+                self._disk_bytes is None
+                or self._disk_bytes > self.max_bytes
+                or self._writes % EVICT_INTERVAL == 0
+            ):
+                self._evict_disk()
+
+    def _remember(self, key: str, value: str) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self) -> None:
+        """Measure the directory and remove the least recently used results
+        until it fits in `max_bytes`. Files being written are skipped."""
+        entries = []
+        for path in self.directory.glob("*/*"):
+            if path.name.startswith(TEMP_PREFIX):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._disk_bytes = total
@@ -1,14 +1,30 @@
 """Typer application of the obfuscator."""
 
+import contextlib
+import hashlib
 import importlib
+import mmap
 import pathlib
+import sys
 import tempfile
 from enum import Enum
 from typing import Any, List, Optional
 
 import typer
 
-from obfuscator import Obfuscator, cparser, ctools, examples
+from obfuscator import (
+    Obfuscator,
+    batch,
+    cparser,
+    ctools,
+    determinism,
+    examples,
+    governor,
+    parallel,
+    pipeline,
+    planner,
+)
+from obfuscator.cache import ObfuscationCache
 
 app = typer.Typer(help="C Code Obfuscator")
 
@@ -19,6 +35,7 @@ class ObfuscatorLevel(Enum):
 
     PassthroughObfuscator = 0
     HarderToRead = 5
+    ConstantReplacementObfuscator = 8
     ReplacementObfuscator = 10
 
     def __str__(self):
@@ -59,8 +76,55 @@ def check_path(path: pathlib.Path):
         raise typer.Abort()
 
 
+def run_obfuscator(
+    obfuscator_engine: Obfuscator,
+    source: str,
+    workers: Optional[int] = None,
+    resource_governor: Optional[governor.ResourceGovernor] = None,
+    name: str = "<source>",
+) -> str:
+    """Obfuscate code, splitting it across worker processes and enforcing
+    resource budgets if requested.
+
+    Args:
+        obfuscator_engine (Obfuscator): obfuscator to use
+        source (str): source code
+        workers (Optional[int], optional): number of worker processes.
+        Defaults to None (sequential).
+        resource_governor (Optional[governor.ResourceGovernor], optional):
+        time and memory budgets. Defaults to None (unlimited).
+        name (str, optional): source file name, for the degradation log.
+        Defaults to "<source>".
+
+    Returns:
+        str: obfuscated code.
+    """
+    if workers is not None and workers > 1:
+        obfuscator_engine = parallel.ParallelObfuscator(obfuscator_engine, workers)
+    if resource_governor is not None:
+        obfuscated = resource_governor.obfuscate(obfuscator_engine, source, name)
+        for degradation in resource_governor.degradations:
+            typer.echo(
+                f">> Exceeded {degradation.reason} budget with"
+                f" ({degradation.requested}), fell back to ({degradation.fallback})"
+            )
+        return obfuscated
+    try:
+        return obfuscator_engine.obfuscate(source)
+    finally:
+        if isinstance(obfuscator_engine, parallel.ParallelObfuscator):
+            obfuscator_engine.close()
+
+
 def obfuscate_at_level(
-    level: int, source: str, output_file: pathlib.Path = None
+    level: int,
+    source: str,
+    output_file: pathlib.Path = None,
+    cache: Optional[ObfuscationCache] = None,
+    workers: Optional[int] = None,
+    resource_governor: Optional[governor.ResourceGovernor] = None,
+    name: str = "<source>",
+    seed: int = 0,
 ) -> str:
     """Get the corresponding obfuscator, obfuscate code, and output result to
     terminal or file accordingly,
@@ -71,23 +135,261 @@ def obfuscate_at_level(
         source (str): source code
         output_file (pathlib.Path, optional): Path to output file.
         Defaults to None.
+        cache (Optional[ObfuscationCache], optional): results cache.
+        Defaults to None.
+        workers (Optional[int], optional): number of worker processes
+        obfuscating the functions. Defaults to None (sequential).
+        resource_governor (Optional[governor.ResourceGovernor], optional):
+        time and memory budgets. Defaults to None (unlimited).
+        name (str, optional): source file name, for the degradation log.
+        Defaults to "<source>".
+        seed (int, optional): seed of the randomized techniques. Defaults to 0.
 
     Returns:
         str: obfuscated code.
     """
     typer.echo(f">> {ObfuscatorLevel(level)}\r\n")
     obfuscator_engine = get_obfuscator_from_level(ObfuscatorLevel(level))
-    obfuscated = obfuscator_engine().obfuscate(source)
+    obfuscated = run_obfuscator(
+        obfuscator_engine(cache=cache, seed=seed),
+        source,
+        workers,
+        resource_governor,
+        name,
+    )
+    output_obfuscated(obfuscated, output_file)
+    return obfuscated
+
+
+def get_planner(
+    max_slowdown: Optional[float], max_growth: Optional[float]
+) -> planner.Planner:
+    """Build the planner of the command line budget.
+
+    Args:
+        max_slowdown (Optional[float]): maximum estimated slowdown per function.
+        None for unlimited.
+        max_growth (Optional[float]): maximum size ratio per function.
+        None for unlimited.
+
+    Returns:
+        planner.Planner: planner
+    """
+    return planner.Planner(
+        max_slowdown=float("inf") if max_slowdown is None else max_slowdown,
+        max_growth=max_growth,
+    )
+
+
+def build_obfuscator(
+    level: int,
+    max_slowdown: Optional[float],
+    max_growth: Optional[float],
+    cache: Optional[ObfuscationCache] = None,
+    seed: int = 0,
+) -> Obfuscator:
+    """Build the obfuscator of the command line options: planned if a budget
+    is set, of the obfuscation level otherwise.
+
+    Args:
+        level (int): obfuscation level
+        max_slowdown (Optional[float]): maximum estimated slowdown per function.
+        max_growth (Optional[float]): maximum size ratio per function.
+        cache (Optional[ObfuscationCache], optional): results cache. Defaults to
+        None.
+        seed (int, optional): seed of the randomized techniques. Defaults to 0.
+
+    Returns:
+        Obfuscator: obfuscator
+    """
+    if max_slowdown is None and max_growth is None:
+        obfuscator_class = get_obfuscator_from_level(ObfuscatorLevel(level))
+        return obfuscator_class(cache=cache, seed=seed)
+    budget_planner = get_planner(max_slowdown, max_growth)
+    return planner.PlannedObfuscator(budget_planner, cache, seed)
+
+
+def obfuscate_with_budget(
+    source: str,
+    max_slowdown: Optional[float],
+    max_growth: Optional[float],
+    output_file: pathlib.Path = None,
+    cache: Optional[ObfuscationCache] = None,
+    workers: Optional[int] = None,
+    resource_governor: Optional[governor.ResourceGovernor] = None,
+    name: str = "<source>",
+    seed: int = 0,
+) -> str:
+    """Plan the techniques to use for each function within the budget,
+    obfuscate code, and output result to terminal or file accordingly,
+    and return obfuscated code.
+
+    Args:
+        source (str): source code
+        max_slowdown (Optional[float]): maximum estimated slowdown per function.
+        None for unlimited.
+        max_growth (Optional[float]): maximum size ratio per function.
+        None for unlimited.
+        output_file (pathlib.Path, optional): Path to output file.
+        Defaults to None.
+        cache (Optional[ObfuscationCache], optional): results cache.
+        Defaults to None.
+        workers (Optional[int], optional): number of worker processes
+        obfuscating the functions. Defaults to None (sequential).
+        resource_governor (Optional[governor.ResourceGovernor], optional):
+        time and memory budgets. Defaults to None (unlimited).
+        name (str, optional): source file name, for the degradation log.
+        Defaults to "<source>".
+        seed (int, optional): seed of the randomized techniques. Defaults to 0.
+
+    Returns:
+        str: obfuscated code.
+    """
+    budget_planner = get_planner(max_slowdown, max_growth)
+    typer.echo(
+        f">> Planned obfuscation (slowdown<={max_slowdown}, growth<={max_growth})"
+    )
+    for plan in budget_planner.plan(source):
+        techniques = ", ".join(technique.__name__ for technique in plan.techniques)
+        typer.echo(
+            f">> {plan.name}: [{techniques}] slowdown {plan.slowdown:.2f}"
+            f" growth {plan.growth:.2f}"
+        )
+    typer.echo("\r\n")
+    obfuscator_engine = planner.PlannedObfuscator(budget_planner, cache, seed)
+    obfuscated = run_obfuscator(
+        obfuscator_engine, source, workers, resource_governor, name
+    )
+    output_obfuscated(obfuscated, output_file)
+    return obfuscated
+
+
+def get_governor(
+    time_budget: Optional[float],
+    memory_budget: Optional[float],
+    degradation_log: Optional[pathlib.Path],
+) -> Optional[governor.ResourceGovernor]:
+    """Build the resource governor from the command line budgets.
+
+    Args:
+        time_budget (Optional[float]): wall time budget, in seconds
+        memory_budget (Optional[float]): memory budget, in MB
+        degradation_log (Optional[pathlib.Path]): degradation log path
+
+    Returns:
+        Optional[governor.ResourceGovernor]: None if there is no budget.
+    """
+    if time_budget is None and memory_budget is None:
+        return None
+    return governor.ResourceGovernor(
+        time_budget=time_budget,
+        memory_budget=None if memory_budget is None else int(memory_budget * 2**20),
+        log_path=degradation_log,
+    )
+
+
+def output_obfuscated(obfuscated: str, output_file: pathlib.Path = None) -> None:
+    """Output obfuscated code to terminal, or to file if passed.
+
+    Args:
+        obfuscated (str): obfuscated code
+        output_file (pathlib.Path, optional): Path to output file.
+        Defaults to None.
+    """
     if output_file is None:
         typer.echo(obfuscated)
         typer.echo("\n\r")
     else:
         check_path(output_file.parent)
         output_file.write_text(obfuscated)
-    return obfuscated
 
 
-def run_function(name: str, source: str, args: Any) -> None:
+def parse_argument(argument: str) -> Any:
+    """Parse a function argument from the command line: an integer, or
+    '@path' for the content of a binary file, memory mapped without copy.
+    The mapping is private: the function can write to it, the file is left
+    untouched.
+
+    Args:
+        argument (str): command line argument
+
+    Raises:
+        typer.BadParameter: if the argument is invalid
+
+    Returns:
+        Any: integer or mmap, to be closed by the caller
+    """
+    if not argument.startswith("@"):
+        try:
+            return int(argument)
+        except ValueError:
+            raise typer.BadParameter(
+                f"({argument}) is neither an integer nor an @path"
+            ) from None
+    try:
+        with open(argument[1:], "rb") as binary_file:
+            return mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError) as error:
+        raise typer.BadParameter(f"Cannot map ({argument[1:]}): {error}") from None
+
+
+def report_determinism(
+    obfuscator_engine: Obfuscator, source: str, obfuscated: str, workers: int
+) -> None:
+    """Obfuscate the source again in several ways (see
+    `determinism.check_determinism`) and output the sha256 of each output.
+
+    Args:
+        obfuscator_engine (Obfuscator): obfuscator used
+        source (str): source code
+        obfuscated (str): output of the command
+        workers (int): number of worker processes of the parallel run
+
+    Raises:
+        typer.Exit: if the outputs differ
+    """
+    digests = {"output": determinism.output_digest(obfuscated)}
+    digests.update(determinism.check_determinism(obfuscator_engine, source, workers))
+    for run, digest in digests.items():
+        typer.echo(f">> {run}: sha256 {digest}")
+    if len(set(digests.values())) > 1:
+        typer.echo(">> Determinism check failed: outputs differ")
+        raise typer.Exit(code=1)
+    typer.echo(">> Determinism check passed")
+
+
+def run_compiled(
+    name: str, runner: ctools.Runner, module: str, function: str, args: List[str]
+) -> None:
+    """Run a compiled C function with arguments parsed from the command line
+    (see `parse_argument`), then output the digest of the buffers passed to the
+    function, so that the results written in place can be compared.
+
+    Args:
+        name (str): name of the run
+        runner (ctools.Runner): runner that compiled the module
+        module (str): module name
+        function (str): function name
+        args (List[str]): command line arguments
+    """
+    typer.echo(f">> Run {name} with args ({', '.join(args)})")
+    with contextlib.ExitStack() as stack:
+        # Parsed for each run, as buffers may be written in place
+        values = []
+        for arg in args:
+            value = parse_argument(arg)
+            if isinstance(value, mmap.mmap):
+                stack.enter_context(value)
+            values.append(value)
+        res = runner.run(module, function, *values)
+        typer.echo(f">> Results: {res} \n\r")
+        for arg, value in zip(args, values):
+            if ctools.is_buffer(value):
+                digest = hashlib.sha256(value).hexdigest()
+                typer.echo(f">> Buffer {arg} sha256: {digest}")
+
+
+def run_function(name: str, source: str, args: List[str]) -> None:
     """Run a C function based on its C code. The function name must be the one
     defined in the source code. Args must correspond to the signature of the
     function.
@@ -96,13 +398,13 @@ def run_function(name: str, source: str, args: Any) -> None:
         name (str): name of the C function
         source (str): source code of the function
         (including #include statements)
-        args (Any): Arguments to pass to the C function
+        args (List[str]): Arguments to pass to the C function, see
+        `parse_argument`.
     """
-    typer.echo(f">> Run {name} with args ({args})")
     with tempfile.TemporaryDirectory() as temp_dir:
         runner = ctools.Runner(pathlib.Path(temp_dir))
-        res = runner.compile_and_run("test", source, *args)
-        typer.echo(f">> Results: {res} \n\r")
+        function_names = runner.compile_source("test", source)
+        run_compiled(name, runner, "test", function_names[0], args)
 
 
 OBFUSCATE_LEVEL_HELP = f"""
@@ -119,8 +421,10 @@ def obfuscate(
     c_file: pathlib.Path = typer.Argument(
         ..., help="Path to a C file that you want to obfuscate"
     ),
-    args: Optional[List[int]] = typer.Argument(
-        None, help="Specify the arguments to pass to the function."
+    args: Optional[List[str]] = typer.Argument(
+        None,
+        help="Specify the arguments to pass to the function: integers, or"
+        " @path to pass the content of a binary file to a pointer parameter.",
     ),
     level: Optional[int] = typer.Option(
         0,
@@ -131,6 +435,60 @@ def obfuscate(
     output_file: Optional[pathlib.Path] = typer.Option(
         None, help="Specify a directory to save the obfuscated code."
     ),
+    max_slowdown: Optional[float] = typer.Option(
+        None,
+        help="Plan techniques per function so that the estimated slowdown of"
+        " each function stays below this ratio (ex: 1.2). Overrides --level.",
+    ),
+    max_growth: Optional[float] = typer.Option(
+        None,
+        help="Plan techniques per function so that the size of each function"
+        " grows less than this ratio (ex: 2.0). Overrides --level.",
+    ),
+    cache_dir: Optional[pathlib.Path] = typer.Option(
+        None,
+        help="Cache obfuscation results in this directory: an identical source"
+        " obfuscated the same way is not obfuscated again.",
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        help="Obfuscate the top-level functions of large files in parallel"
+        " with this many processes. The result is the same. With --batch,"
+        " obfuscate this many records in parallel instead.",
+    ),
+    time_budget: Optional[float] = typer.Option(
+        None,
+        help="Wall time budget in seconds. When exceeded, fall back to a cheaper"
+        " obfuscation level (down to passthrough).",
+    ),
+    memory_budget: Optional[float] = typer.Option(
+        None,
+        help="Memory budget in MB. When exceeded, fall back to a cheaper"
+        " obfuscation level (down to passthrough).",
+    ),
+    degradation_log: Optional[pathlib.Path] = typer.Option(
+        None,
+        help="Append a JSON line to this file for each fallback due to a budget.",
+    ),
+    seed: int = typer.Option(
+        0,
+        help="Seed of the randomized techniques. The output only depends on the"
+        " source, the obfuscation options and the seed.",
+    ),
+    check_determinism: bool = typer.Option(
+        False,
+        "--check-determinism",
+        help="Obfuscate again (repeated, parallel and fresh interpreter runs)"
+        " and check that the outputs are byte-for-byte identical. Not supported"
+        " with budgets.",
+    ),
+    batch_format: Optional[batch.RecordFormat] = typer.Option(
+        None,
+        "--batch",
+        help="Read a stream of source records from stdin (C_FILE must be '-')"
+        " and write only the obfuscated records to stdout: 'nul' terminated"
+        " records, or 'length' prefixed records ('<bytes>\\n<record>').",
+    ),
 ):
     """Obfuscate passed c_file (as path). If ARGS are passed to the command,
     the function will be ran before and after obfuscation using passed
@@ -138,14 +496,98 @@ def obfuscate(
 
     If --output-file is not used, obfuscated code will output in terminal.
     """
+    if batch_format is not None:
+        if str(c_file) != "-":
+            typer.echo(">> Pass '-' as C_FILE to read the records from stdin", err=True)
+            raise typer.Exit(code=1)
+        if args or output_file or check_determinism or time_budget or memory_budget:
+            typer.echo(
+                ">> ARGS, --output-file, --check-determinism and budgets are not"
+                " supported with --batch",
+                err=True,
+            )
+            raise typer.Exit(code=1)
+        cache = None if cache_dir is None else ObfuscationCache(directory=cache_dir)
+        obfuscator_engine = build_obfuscator(
+            level, max_slowdown, max_growth, cache, seed
+        )
+        try:
+            count = batch.obfuscate_stream(
+                obfuscator_engine.obfuscate,
+                sys.stdin.buffer,
+                sys.stdout.buffer,
+                batch_format,
+                workers,
+            )
+        except batch.RecordError as error:
+            typer.echo(f">> Invalid record stream: {error}", err=True)
+            raise typer.Exit(code=1)
+        typer.echo(f">> Obfuscated ({count}) records", err=True)
+        return
+    if check_determinism and (time_budget or memory_budget):
+        # A fallback due to a budget depends on the run, not only on the options
+        typer.echo(">> --check-determinism is not supported with budgets", err=True)
+        raise typer.Exit(code=1)
     check_path(c_file)
     source = c_file.read_text()
-    obfuscated = obfuscate_at_level(level, source, output_file)
+    cache = None if cache_dir is None else ObfuscationCache(directory=cache_dir)
+    resource_governor = get_governor(time_budget, memory_budget, degradation_log)
+    options = {
+        "cache": cache,
+        "workers": workers,
+        "resource_governor": resource_governor,
+        "name": str(c_file),
+        "seed": seed,
+    }
+    if max_slowdown is None and max_growth is None:
+        obfuscated = obfuscate_at_level(level, source, output_file, **options)
+    else:
+        obfuscated = obfuscate_with_budget(
+            source, max_slowdown, max_growth, output_file, **options
+        )
+    if cache is not None:
+        typer.echo(f">> Cache: {cache}")
+    if check_determinism:
+        obfuscator_engine = build_obfuscator(level, max_slowdown, max_growth, seed=seed)
+        report_determinism(obfuscator_engine, source, obfuscated, workers or 2)
     if args:
         run_function("original", source, args)
         run_function("obfuscated", obfuscated, args)
 
 
+@app.command(context_settings={"ignore_unknown_options": True})
+def cc(
+    gcc_command: List[str] = typer.Argument(
+        ..., help="gcc command line, starting with the compiler, after '--'."
+    ),
+    level: Optional[int] = typer.Option(
+        0,
+        "--level",
+        "-l",
+        help=OBFUSCATE_LEVEL_HELP,
+    ),
+    cache_dir: Optional[pathlib.Path] = typer.Option(
+        None,
+        help="Cache obfuscation results in this directory.",
+    ),
+    seed: int = typer.Option(0, help="Seed of the randomized techniques."),
+):
+    """Compiler wrapper, usable as a drop-in CC: obfuscate the C files of the
+    gcc command line in memory and pipe them to gcc, keeping all other flags.
+
+    Example: bmaingret-obfuscator cc -l 10 -- gcc -c foo.c -o foo.o -MMD
+    """
+    cache = None if cache_dir is None else ObfuscationCache(directory=cache_dir)
+    obfuscator_class = get_obfuscator_from_level(ObfuscatorLevel(level))
+    obfuscator_engine = obfuscator_class(cache=cache, seed=seed)
+    try:
+        returncode = ctools.gcc_wrap(gcc_command, obfuscator_engine.obfuscate)
+    except ValueError as error:
+        typer.echo(f">> {error}", err=True)
+        raise typer.Exit(code=1)
+    raise typer.Exit(code=returncode)
+
+
 @app.command()
 def demo(
     function: str = typer.Argument(
@@ -154,8 +596,10 @@ def demo(
 Available functions:\r\n
 {examples.available_example_help()}\r\n""",
     ),
-    args: Optional[List[int]] = typer.Argument(
-        None, help="Specify the arguments to pass to the function."
+    args: Optional[List[str]] = typer.Argument(
+        None,
+        help="Specify the arguments to pass to the function: integers, or"
+        " @path to pass the content of a binary file to a pointer parameter.",
     ),
 ):
     """Run test function through available obfuscator, print resulting
@@ -165,10 +609,30 @@ Available functions:\r\n
 
     source = examples.available_examples()[function]["path"].read_text()
 
-    for level in ObfuscatorLevel:
-        obfuscated = obfuscate_at_level(level, source)
-        if args:
-            run_function(f"obfuscated level {level}", obfuscated, args)
+    # Levels sharing techniques are obfuscated once, and compiled together
+    executor = pipeline.PipelineExecutor(
+        {
+            level: get_obfuscator_from_level(level)().techniques
+            for level in ObfuscatorLevel
+        }
+    )
+    variants = executor.obfuscate(source)
+    for level, obfuscated in variants.items():
+        typer.echo(f">> {level}\r\n")
+        output_obfuscated(obfuscated)
+
+    if args:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            runner = ctools.Runner(pathlib.Path(temp_dir))
+            compiled = executor.compile(variants, runner)
+            for level, (module, function_names) in compiled.items():
+                run_compiled(
+                    f"obfuscated level {level}",
+                    runner,
+                    module,
+                    function_names[0],
+                    args,
+                )
 
     if not args:
         typer.echo(
@@ -181,14 +645,30 @@ Available functions:\r\n
 def parser(
     show_ast: Optional[bool] = typer.Option(
         False, "--show-ast", help="Additionnaly show AST for the test function"
-    )
+    ),
+    time_budget: Optional[float] = typer.Option(
+        None, help="Wall time budget of the parser in seconds."
+    ),
+    memory_budget: Optional[float] = typer.Option(
+        None, help="Memory budget of the parser in MB."
+    ),
 ):
     """Simply show identified function applying cpyparser to a test function."""
     example = examples.available_examples()["pi.c"]["path"]
-    typer.echo(cparser.show_func_defs(example))
-
-    if show_ast:
-        typer.echo(cparser.show_ast(example))
+    resource_governor = get_governor(time_budget, memory_budget, None)
+    if resource_governor is None:
+        typer.echo(cparser.show_func_defs(example))
+        if show_ast:
+            typer.echo(cparser.show_ast(example))
+        return
+
+    try:
+        typer.echo(resource_governor.run(cparser.show_func_defs, example))
+        if show_ast:
+            typer.echo(resource_governor.run(cparser.show_ast, example))
+    except governor.BudgetExceededError as error:
+        typer.echo(f">> Parser stopped: {error}")
+        raise typer.Exit(code=1)
 
 
 if __name__ == "__main__":
@@ -2,14 +2,74 @@
 signature, generating #include statement, etc. """
 
 import importlib
+import importlib.util
+import multiprocessing
 import pathlib
 import re
 import subprocess
 import sys
-from typing import Any, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 from cffi import FFI
 
+# gcc options taking their value as the next argument
+GCC_OPTIONS_WITH_VALUE = frozenset(
+    [
+        "-D",
+        "-I",
+        "-L",
+        "-MF",
+        "-MQ",
+        "-MT",
+        "-U",
+        "-Xassembler",
+        "-Xlinker",
+        "-Xpreprocessor",
+        "-idirafter",
+        "-imacros",
+        "-include",
+        "-iquote",
+        "-isystem",
+        "-o",
+        "-x",
+    ]
+)
+# gcc options writing make dependencies
+GCC_DEPENDENCY_OPTIONS = frozenset(["-M", "-MM", "-MD", "-MMD"])
+WORD_PATTERN = re.compile(r"\w+")
+SPACES_PATTERN = re.compile(r"\s+")
+C_KEYWORDS = frozenset(
+    [
+        "break",
+        "case",
+        "continue",
+        "default",
+        "do",
+        "else",
+        "enum",
+        "for",
+        "goto",
+        "if",
+        "return",
+        "sizeof",
+        "struct",
+        "switch",
+        "typedef",
+        "union",
+        "while",
+    ]
+)
+
 
 def generate_include_lib_str(lib: str) -> str:
     """Generate an C include statement.
@@ -70,9 +130,209 @@ def is_lib_included(source: str, lib: str) -> bool:
     return lib in get_includes(source)
 
 
+class FunctionSignature(NamedTuple):
+    """Function signature found by `scan_function_signatures`. Offsets are
+    indexes in the scanned source code.
+
+    Attributes:
+        return_type (str): return type, including specifiers (ex: 'static int')
+        name (str): function name
+        parameters (str): parameter list, without the parentheses
+        start (int): start of the signature
+        end (int): end of the signature (after the closing parenthesis)
+        body_end (Optional[int]): end of the function body (after the closing
+        brace), None for a declaration.
+        text (str): signature, whitespaces collapsed, without ending semi-colon.
+    """
+
+    return_type: str
+    name: str
+    parameters: str
+    start: int
+    end: int
+    body_end: Optional[int]
+    text: str
+
+
+def _tokenize(source: str) -> List[Tuple[str, int, int]]:
+    """Split the source code in (kind, start, end) tokens in a single pass.
+    Kinds are 'word' (identifiers, keywords and numbers), 'punct' (a single
+    character) and 'preprocessor' (a whole directive). Whitespaces, comments and
+    literals are skipped.
+
+    Args:
+        source (str): source code
+
+    Returns:
+        List[Tuple[str, int, int]]: tokens
+    """
+    tokens = []
+    index = 0
+    length = len(source)
+    line_start = True
+    while index < length:
+        char = source[index]
+        if char.isspace():
+            end = SPACES_PATTERN.match(source, index).end()
+            line_start = line_start or source.find("\n", index, end) >= 0
+            index = end
+        elif char == "#" and line_start:
+            end = source.find("\n", index)
+            # Line continuations
+            while end > 0 and source[end - 2 : end].rstrip("\r").endswith("\\"):
+                end = source.find("\n", end + 1)
+            end = length if end < 0 else end
+            tokens.append(("preprocessor", index, end))
+            index = end
+        elif source.startswith("//", index):
+            end = source.find("\n", index)
+            index = length if end < 0 else end
+        elif source.startswith("/*", index):
+            end = source.find("*/", index + 2)
+            index = length if end < 0 else end + 2
+        elif char in "\"'":
+            end = index + 1
+            while end < length and source[end] != char:
+                end += 2 if source[end] == "\\" else 1
+            index = end + 1
+            line_start = False
+        elif match := WORD_PATTERN.match(source, index):
+            tokens.append(("word", index, match.end()))
+            index = match.end()
+            line_start = False
+        else:
+            tokens.append(("punct", index, index + 1))
+            index += 1
+            line_start = False
+    return tokens
+
+
+def _closing_token(source: str, tokens: List[Tuple[str, int, int]], index: int) -> int:
+    """Find the index of the token closing the bracket token at `index`.
+
+    Args:
+        source (str): source code
+        tokens (List[Tuple[str, int, int]]): source code tokens
+        index (int): index of the opening bracket token
+
+    Returns:
+        int: index of the closing token, or of the last token if unbalanced.
+    """
+    opening = source[tokens[index][1]]
+    closing = {"(": ")", "{": "}", "[": "]"}[opening]
+    depth = 0
+    for position in range(index, len(tokens)):
+        kind, start, _ = tokens[position]
+        if kind != "punct":
+            continue
+        if source[start] == opening:
+            depth += 1
+        elif source[start] == closing:
+            depth -= 1
+            if depth == 0:
+                return position
+    return len(tokens) - 1
+
+
+def _collapse_spaces(text: str) -> str:
+    return SPACES_PATTERN.sub(" ", text).strip()
+
+
+def scan_function_signatures(
+    source: str, declarations: bool = False
+) -> List[FunctionSignature]:
+    """Find the function definitions of the source code, in linear time.
+
+    The source code is tokenized once, then the top-level tokens are walked
+    once: an identifier followed by a parenthesized list, preceded by at least
+    a return type, and followed by a body (or a semi-colon, for declarations) is
+    a function. Bodies and other brackets are skipped in a single pass, so each
+    token is visited a bounded number of times. Parameter lists can span
+    multiple lines.
+
+    Args:
+        source (str): source code
+        declarations (bool, optional): also return function declarations
+        (prototypes, signatures ending the source code and K&R definitions).
+        Defaults to False.
+
+    Returns:
+        List[FunctionSignature]: signatures, in source order.
+    """
+    tokens = _tokenize(source)
+    signatures = []
+    declaration_start = None
+    previous = None
+    index = 0
+    while index < len(tokens):
+        kind, start, end = tokens[index]
+        char = source[start]
+        if kind == "preprocessor" or (kind == "punct" and char == ";"):
+            declaration_start, previous = None, None
+            index += 1
+            continue
+        if declaration_start is None:
+            declaration_start = start
+        if kind == "punct" and char in "({[":
+            closing = _closing_token(source, tokens, index)
+            is_candidate = (
+                char == "("
+                and previous is not None
+                and previous[0] == "word"
+                and previous[1] > declaration_start
+                and source[previous[1] : previous[2]] not in C_KEYWORDS
+                and not source[previous[1]].isdigit()
+            )
+            following = tokens[closing + 1] if closing + 1 < len(tokens) else None
+            if is_candidate and source[tokens[closing][1]] == ")":
+                follow_kind, follow_char = "", ""
+                if following is not None:
+                    follow_kind, follow_char = following[0], source[following[1]]
+                body_end = None
+                if follow_kind == "punct" and follow_char == "{":
+                    body_closing = _closing_token(source, tokens, closing + 1)
+                    body_end = tokens[body_closing][2]
+                # Declarations: prototypes, bare signatures ending the source and
+                # K&R definitions (followed by their parameter declarations)
+                is_declaration = declarations and (
+                    following is None
+                    or follow_kind == "word"
+                    or (follow_kind == "punct" and follow_char == ";")
+                )
+                if body_end is not None or is_declaration:
+                    signature_end = tokens[closing][2]
+                    signatures.append(
+                        FunctionSignature(
+                            return_type=_collapse_spaces(
+                                source[declaration_start : previous[1]]
+                            ),
+                            name=source[previous[1] : previous[2]],
+                            parameters=_collapse_spaces(
+                                source[end : tokens[closing][1]]
+                            ),
+                            start=declaration_start,
+                            end=signature_end,
+                            body_end=body_end,
+                            text=_collapse_spaces(
+                                source[declaration_start:signature_end]
+                            ),
+                        )
+                    )
+                    if body_end is not None:
+                        index = body_closing + 1
+                        declaration_start, previous = None, None
+                        continue
+            previous = tokens[closing]
+            index = closing + 1
+            continue
+        previous = (kind, start, end)
+        index += 1
+    return signatures
+
+
 def get_function_signatures(source: str) -> List[str]:
-    """Return a list of the functions signature present in the source code
-    (regex based).
+    """Return a list of the functions signature defined in the source code
+    (see `scan_function_signatures`).
         Signatures will include an ending semi-colon.
     Args:
         source (str): source code
@@ -80,10 +340,24 @@ def get_function_signatures(source: str) -> List[str]:
     Returns:
         List[str]: List of signatures, each with an ending semi-colon.
     """
-    function_pattern = r"^[^\S\r\n]*((?:[\w\*]+(?: )*?){2,}\([^!@#$+%^;]+?\)(?!\s*;))"
-    compiled_pattern = re.compile(function_pattern, re.M)
-    functions = re.findall(compiled_pattern, source)
-    return [function + ";" for function in functions]
+    return [signature.text + ";" for signature in scan_function_signatures(source)]
+
+
+def get_cdef(source: str) -> str:
+    """Generate the header declaring every function defined in the source
+    code, as expected by CFFI `cdef`. Storage and inline specifiers are dropped.
+
+    Args:
+        source (str): source code
+
+    Returns:
+        str: one signature per line.
+    """
+    specifiers_pattern = r"\b(?:static|inline|extern)\s+"
+    return "\n".join(
+        re.sub(specifiers_pattern, "", signature)
+        for signature in get_function_signatures(source)
+    )
 
 
 def count_args(function_def: str) -> int:
@@ -99,7 +373,7 @@ def count_args(function_def: str) -> int:
 
 
 def get_function_name(function_signature: str) -> str:
-    """Regex the function name from a function signature.
+    """Find the function name from a function signature or definition.
 
     Args:
         function_signature (str): function signature
@@ -110,11 +384,9 @@ def get_function_name(function_signature: str) -> str:
     Returns:
         str: function name
     """
-    name_pattern = r"^[^\S\r\n]*(?:([\w\*]+(?: )*?){2,}\([^!@#$+%^;]+?\))"
-    compiled_pattern = re.compile(name_pattern, re.M)
-    function_name = re.search(compiled_pattern, function_signature)
-    if function_name:
-        return function_name.group(1)
+    signatures = scan_function_signatures(function_signature, declarations=True)
+    if signatures:
+        return signatures[0].name
     raise ValueError(f"Trouble finding function name in ({function_signature})")
 
 
@@ -143,6 +415,294 @@ def gcc_compile(module: str, source: str, tmp_dir: pathlib.Path) -> str:
     return results
 
 
+def get_gcc_c_inputs(command: List[str]) -> List[int]:
+    """Find the C source files passed to a gcc command line.
+
+    Args:
+        command (List[str]): gcc command line, starting with the compiler
+
+    Returns:
+        List[int]: indexes of the C inputs in the command line.
+    """
+    inputs = []
+    index = 1
+    while index < len(command):
+        argument = command[index]
+        if argument in GCC_OPTIONS_WITH_VALUE:
+            index += 2
+            continue
+        if not argument.startswith("-") and argument.endswith(".c"):
+            inputs.append(index)
+        index += 1
+    return inputs
+
+
+def has_gcc_option(command: List[str], option: str) -> bool:
+    """Whether a gcc option taking a value is set, with its value either as
+    the next argument (`-o file`) or joined (`-ofile`).
+
+    Args:
+        command (List[str]): gcc command line
+        option (str): option (ex: '-o')
+
+    Returns:
+        bool: True if set
+    """
+    return any(argument.startswith(option) for argument in command[1:])
+
+
+def gcc_option_value(command: List[str], option: str) -> Optional[str]:
+    """Value of a gcc option, either the next argument (`-o file`) or joined
+    (`-ofile`). The last occurrence wins, as for gcc.
+
+    Args:
+        command (List[str]): gcc command line
+        option (str): option (ex: '-o')
+
+    Returns:
+        Optional[str]: value, None if the option is not set
+    """
+    value = None
+    for index, argument in enumerate(command[1:], 1):
+        if argument == option:
+            value = command[index + 1] if index + 1 < len(command) else None
+        elif argument.startswith(option):
+            value = argument[len(option) :]
+    return value
+
+
+def gcc_dependency_output(command: List[str]) -> Optional[str]:
+    """Where a gcc command line writes its make dependencies.
+
+    Args:
+        command (List[str]): gcc command line
+
+    Returns:
+        Optional[str]: dependency file, '-' for stdout, None if no dependencies
+        are written (or to a file named after the input).
+    """
+    options = set(command)
+    if not options & GCC_DEPENDENCY_OPTIONS:
+        return None
+    dependency_file = gcc_option_value(command, "-MF")
+    if dependency_file is not None:
+        return dependency_file
+    output = gcc_option_value(command, "-o")
+    if options & {"-MD", "-MMD"}:
+        # Written along the output, without replacing it
+        return None if output is None else str(pathlib.Path(output).with_suffix(".d"))
+    # Written instead of the output
+    return "-" if output is None else output
+
+
+def add_dependency(rules: str, prerequisite: str) -> str:
+    """Add a prerequisite first to the first rule of make dependencies.
+
+    Args:
+        rules (str): make rules, as written by gcc
+        prerequisite (str): path of the prerequisite
+
+    Returns:
+        str: rules with the prerequisite
+    """
+    separator = rules.find(":")
+    if separator < 0:
+        return rules
+    escaped = prerequisite.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+    return f"{rules[: separator + 1]} {escaped}{rules[separator + 1 :]}"
+
+
+def _gcc_stdin_command(command: List[str], c_input: str) -> List[str]:
+    """Build the command compiling a single C input read from stdin, with the
+    same outputs (object, dependency file) as when compiling the file itself.
+    The directory of the input is searched first for quoted includes, as it
+    would be for the file itself.
+    """
+    options = set(command)
+    path = pathlib.Path(c_input)
+    command = command[:1] + ["-iquote", str(path.parent)] + command[1:]
+    extra = []
+    has_output = has_gcc_option(command, "-o")
+    # With -M and -MM, dependencies are written instead of the output
+    if not has_output and not options & {"-M", "-MM"}:
+        if "-S" in options:
+            extra += ["-o", f"{path.stem}.s"]
+        elif "-c" in options and "-E" not in options:
+            extra += ["-o", f"{path.stem}.o"]
+    # Without output file, dependency targets would be named after stdin
+    dependencies = options & GCC_DEPENDENCY_OPTIONS
+    has_target = any(has_gcc_option(command + extra, opt) for opt in ("-MT", "-MQ"))
+    if dependencies and not (has_output or "-o" in extra or has_target):
+        extra += ["-MQ", f"{path.stem}.o"]
+    return command + extra + ["-xc", "-", "-x", "none"]
+
+
+def line_directive(source: str, obfuscated: str, c_input: str) -> str:
+    """Prefix the obfuscated source with a `#line` directive so that
+    diagnostics and `__FILE__` point to the original file. The directive is
+    placed after the include statements inserted by the techniques, so that the
+    original first line is numbered 1.
+
+    Args:
+        source (str): original source code
+        obfuscated (str): obfuscated source code
+        c_input (str): path of the original file
+
+    Returns:
+        str: obfuscated source code with the directive
+    """
+    included = set(get_includes(source))
+    lines = obfuscated.split("\n")
+    injected = 0
+    while injected < len(lines) - 1:
+        includes = get_includes(lines[injected])
+        if len(includes) != 1 or includes[0] in included:
+            break
+        injected += 1
+    escaped = c_input.replace("\\", "\\\\").replace('"', '\\"')
+    directive = f'#line 1 "{escaped}"'
+    return "\n".join(lines[:injected] + [directive] + lines[injected:])
+
+
+def gcc_wrap(command: List[str], obfuscate: Callable[[str], str]) -> int:
+    """Run a gcc command line, obfuscating its C inputs in memory: each
+    obfuscated source is piped to gcc stdin (`-xc -`), all other arguments are
+    kept. A `#line` directive keeps diagnostics and `__FILE__` pointing to the
+    original file (see `line_directive`), and the original file is added to the
+    make dependencies (see `add_dependency`).
+
+    Args:
+        command (List[str]): gcc command line, starting with the compiler
+        obfuscate (Callable[[str], str]): obfuscation of a source code
+
+    Raises:
+        ValueError: if several C inputs are linked, or compiled to a single
+        output, or if a C input cannot be read
+
+    Returns:
+        int: gcc return code (the first non zero one if several runs)
+    """
+    inputs = get_gcc_c_inputs(command)
+    if not inputs:
+        return subprocess.run(command, check=False).returncode
+    options = set(command)
+    compile_only = bool(options & {"-c", "-S", "-E"})
+    if len(inputs) > 1 and (not compile_only or has_gcc_option(command, "-o")):
+        raise ValueError(
+            "Several C inputs can only be obfuscated when compiling (-c, -S, -E)"
+            " without -o."
+        )
+    others = [arg for index, arg in enumerate(command) if index not in inputs]
+    for index in inputs:
+        c_input = command[index]
+        try:
+            source = pathlib.Path(c_input).read_text()
+        except OSError as error:
+            raise ValueError(f"Cannot read C input ({c_input}): {error}") from None
+        obfuscated = line_directive(source, obfuscate(source), c_input)
+        stdin_command = _gcc_stdin_command(others, c_input)
+        dependency_output = gcc_dependency_output(stdin_command)
+        process = subprocess.run(
+            stdin_command,
+            input=obfuscated,
+            stdout=subprocess.PIPE if dependency_output == "-" else None,
+            text=True,
+            check=False,
+        )
+        if dependency_output == "-":
+            sys.stdout.write(
+                add_dependency(process.stdout, c_input)
+                if not process.returncode
+                else process.stdout
+            )
+            sys.stdout.flush()
+        if process.returncode:
+            return process.returncode
+        if dependency_output not in (None, "-"):
+            dependency_file = pathlib.Path(dependency_output)
+            if dependency_file.exists():
+                rules = add_dependency(dependency_file.read_text(), c_input)
+                dependency_file.write_text(rules)
+    return 0
+
+
+def load_module(module: str, path: str) -> Any:
+    """Import a compiled CFFI module from its path, without going through
+    `sys.path` and the import cache.
+
+    Args:
+        module (str): module name
+        path (str): path of the compiled extension
+
+    Returns:
+        Any: the CFFI extension module
+    """
+    spec = importlib.util.spec_from_file_location(module, path)
+    my_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(my_module)
+    return my_module
+
+
+def is_buffer(value: Any) -> bool:
+    """Whether the value supports the buffer protocol (ex: bytearray,
+    memoryview, mmap, NumPy arrays).
+
+    Args:
+        value (Any): value
+
+    Returns:
+        bool: True for buffers
+    """
+    try:
+        memoryview(value)
+    except TypeError:
+        return False
+    return True
+
+
+def buffer_arguments(ffi: FFI, function: Any, args: Sequence[Any]) -> List[Any]:
+    """Pass the buffers (see `is_buffer`) to the pointer parameters of a
+    compiled function as pointers to their memory, without copy: the function
+    reads and writes the memory of the Python objects in place. Read-only
+    buffers (ex: bytes) are copied, so that the function cannot modify
+    immutable objects. Other arguments are left as is.
+
+    Args:
+        ffi (FFI): FFI of the compiled module
+        function (Any): compiled function
+        args (Sequence[Any]): arguments
+
+    Raises:
+        ValueError: if a buffer is passed to a parameter that is not a pointer.
+
+    Returns:
+        List[Any]: converted arguments
+    """
+    parameters = ffi.typeof(function).args
+    converted = []
+    for position, arg in enumerate(args):
+        if not is_buffer(arg) or isinstance(arg, ffi.CData):
+            converted.append(arg)
+            continue
+        if position >= len(parameters) or parameters[position].kind != "pointer":
+            raise ValueError(f"Argument ({position}) is a buffer but not a pointer")
+        item = parameters[position].item
+        cname = "char" if item.kind == "void" else item.cname
+        if memoryview(arg).readonly:
+            arg = bytearray(arg)
+        converted.append(ffi.from_buffer(f"{cname}[]", arg, require_writable=True))
+    return converted
+
+
+def _build_module(tmpdir: str, module: str, source: str, header: str) -> str:
+    """Build a CFFI extension in a worker process (CFFI changes the current
+    directory while compiling) and return its path."""
+    ffibuilder = FFI()
+    ffibuilder.cdef(header)
+    ffibuilder.set_source(module, source)
+    return ffibuilder.compile(verbose=False, tmpdir=tmpdir)
+
+
 class Runner:
     """Wrapper around CCFI to run C code and compare results between different
      functions.
@@ -151,20 +711,29 @@ class Runner:
     tmpdir (pathlib.Path): Storage of artifacts.
     compiled_modules (Set[str]): Already compiled modules, used to avoid name
     conflict.
+    module_paths (Dict[str, str]): Path of the extension built for each
+    compiled module.
+    pool (Optional[pool.ExecutionPool]): when set, compiled functions are run
+    in the pool workers instead of the current process.
     """
 
-    def __init__(self, tmpdir: pathlib.Path):
+    def __init__(self, tmpdir: pathlib.Path, pool=None):
         """Default init
 
         Args:
             tmpdir (pathlib.Path): Temporary directory for artifacts
+            pool (pool.ExecutionPool, optional): pool used to run the compiled
+            functions in isolated processes. Defaults to None.
         """
         self.tmpdir = tmpdir.resolve()
         self.compiled_modules = set()
+        self.module_paths: Dict[str, str] = {}
+        self.pool = pool
+        self._loaded_modules: Dict[str, Any] = {}
 
     def compile(self, module: str, source: str, header: str) -> None:
-        """Compile the source code using CFFI. Only tested for a single function
-         in source.
+        """Compile the source code using CFFI. Only the functions declared in
+        the header are exposed.
 
         Args:
             module (str): module name (ie. output file name).
@@ -181,13 +750,91 @@ class Runner:
         self.ffibuilder = FFI()
         self.ffibuilder.cdef(header)
         self.ffibuilder.set_source(module, source)
-        self.ffibuilder.compile(verbose=False, tmpdir=str(self.tmpdir))
+        path = self.ffibuilder.compile(verbose=False, tmpdir=str(self.tmpdir))
         self.compiled_modules.add(f"{module}")
+        self.module_paths[module] = path
 
-    def run(self, module: str, funcname: str, *args: Any) -> Any:
-        """Run an already compiled function. Modify path to include the
+    def compile_source(self, module: str, source: str) -> List[str]:
+        """Compile a whole source file in a single build, exposing all its
+        functions.
+
+        Args:
+            module (str): module name (ie. output file name).
+            source (str): source code
+
+        Returns:
+            List[str]: names of the exposed functions, in source order.
+        """
+        signatures = scan_function_signatures(source)
+        self.compile(module, source, get_cdef(source))
+        return [signature.name for signature in signatures]
+
+    def compile_sources(
+        self, sources: Dict[str, str], workers: int = None
+    ) -> Dict[str, List[str]]:
+        """Compile several source files in parallel worker processes, each in
+        a single build exposing all its functions.
+
+        Args:
+            sources (Dict[str, str]): source code of each module
+            workers (int, optional): number of worker processes. Defaults to
+            the number of CPUs.
+
+        Raises:
+            ValueError: if a module has already been compiled
+
+        Returns:
+            Dict[str, List[str]]: names of the exposed functions of each module,
+            in source order.
+        """
+        for module in sources:
+            if module in self.compiled_modules:
+                raise ValueError(f"Module ({module}) already compiled. Name conflict.")
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = {
+                module: executor.submit(
+                    _build_module, str(self.tmpdir), module, source, get_cdef(source)
+                )
+                for module, source in sources.items()
+            }
+            for module, future in futures.items():
+                self.module_paths[module] = future.result()
+                self.compiled_modules.add(module)
+        return {
+            module: [signature.name for signature in scan_function_signatures(source)]
+            for module, source in sources.items()
+        }
+
+    def load(self, module: str) -> Any:
+        """Import an already compiled module. Modules compiled by this runner
+        are loaded from their build path, others are imported from the
         artifacts directory.
-        Import the compiled module with CFFI, and run the function.
+
+        Args:
+            module (str): module name
+
+        Returns:
+            Any: the CFFI extension module
+        """
+        if module not in self._loaded_modules:
+            if module in self.module_paths:
+                my_module = load_module(module, self.module_paths[module])
+            else:
+                sys.path.insert(0, str(self.tmpdir))
+                my_module = importlib.import_module(module)
+            self._loaded_modules[module] = my_module
+        return self._loaded_modules[module]
+
+    def run(self, module: str, funcname: str, *args: Any) -> Any:
+        """Run an already compiled function.
+        Import the compiled module with CFFI, and run the function, in a pool
+        worker if the runner has a pool.
+
+        Buffers (see `buffer_arguments`) are passed to pointer parameters
+        without copy when run in the current process. In a pool worker, they are
+        copied to shared memory and the results copied back after the call.
 
         Args:
             module (str): module name
@@ -196,8 +843,13 @@ class Runner:
         Returns:
             Any: function run result
         """
-        sys.path.insert(0, str(self.tmpdir))
-        my_module = importlib.import_module(module)
+        if self.pool is not None and module in self.module_paths:
+            return self.pool.call(self.module_paths[module], module, funcname, *args)
+        my_module = self.load(module)
+        if any(is_buffer(arg) for arg in args) and callable(
+            function := getattr(my_module.lib, funcname, None)
+        ):
+            args = buffer_arguments(my_module.ffi, function, args)
         return self._run_function_by_name(my_module.lib, funcname, *args)
 
     def _run_function_by_name(self, module: str, funcname: str, *args) -> Any:
@@ -214,20 +866,26 @@ class Runner:
         if hasattr(module, funcname) and callable(func := getattr(module, funcname)):
             return func(*args)
 
-    def compile_and_run(self, module: str, function_source: str, *args) -> Any:
-        """Helper that run compile and run function in one go
+    def compile_and_run(
+        self, module: str, function_source: str, *args, function_name: str = None
+    ) -> Any:
+        """Helper that run compile and run function in one go. The whole source
+        is compiled, so other functions of the module can then be run with
+        `run` without compiling again.
 
         Args:
             module (str): module name
             function_source (str): source code containing the function
             definition
+            function_name (str, optional): function to run. Defaults to the
+            first function of the source code.
 
         Returns:
             Any: function run result
         """
-        function_definition = get_function_signatures(function_source)[0]
-        function_name = get_function_name(function_definition)
-        self.compile(module, function_source, function_definition)
+        function_names = self.compile_source(module, function_source)
+        if function_name is None:
+            function_name = function_names[0]
         result = self.run(module, function_name, *args)
         return result
 
@@ -249,3 +907,30 @@ class Runner:
         res_a = self.compile_and_run("module_a", src_function_a, *args)
         res_b = self.compile_and_run("module_b", src_function_b, *args)
         return res_a == res_b
+
+    def compare_sources(
+        self,
+        source_a: str,
+        source_b: str,
+        calls: Dict[str, Sequence[Any]],
+        modules: Sequence[str] = ("source_a", "source_b"),
+    ) -> Dict[str, bool]:
+        """Compile two source files once each, run every requested function
+        on both, and compare the return values function by function.
+
+        Args:
+            source_a (str): source code A
+            source_b (str): source code B
+            calls (Dict[str, Sequence[Any]]): arguments for each function name.
+            modules (Sequence[str], optional): module names used for A and B.
+
+        Returns:
+            Dict[str, bool]: whether results are equals, per function name.
+        """
+        module_a, module_b = modules
+        self.compile_source(module_a, source_a)
+        self.compile_source(module_b, source_b)
+        return {
+            name: self.run(module_a, name, *args) == self.run(module_b, name, *args)
+            for name, args in calls.items()
+        }
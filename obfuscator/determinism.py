@@ -0,0 +1,101 @@
+"""Check that the obfuscated output is byte-for-byte reproducible.
+
+Build caches (ccache, remote artifact caches) only hit when the obfuscated
+source code is identical across runs and machines. `check_determinism`
+obfuscates the same source code several times, without cache: twice
+sequentially, split across worker processes (see `ParallelObfuscator`), and in
+a fresh interpreter with another hash seed (as on another machine), then
+compares the sha256 of the outputs.
+
+"""
+
+import copy
+import hashlib
+import os
+import pickle
+import subprocess
+import sys
+from typing import Dict
+
+from obfuscator import Obfuscator
+from obfuscator.parallel import ParallelObfuscator
+
+# Hash seed of the fresh interpreter run, to reveal set or dict ordering
+# depending on string hashes.
+SUBPROCESS_HASH_SEED = "1"
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def output_digest(obfuscated: str) -> str:
+    """sha256 of an obfuscated source code, as written to a file.
+
+    Args:
+        obfuscated (str): obfuscated source code
+
+    Returns:
+        str: hex digest
+    """
+    return hashlib.sha256(obfuscated.encode()).hexdigest()
+
+
+def _obfuscate_in_subprocess(obfuscator: Obfuscator, source_code: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-m", "obfuscator.determinism"],
+        input=pickle.dumps((obfuscator, source_code)),
+        stdout=subprocess.PIPE,
+        env={
+            **os.environ,
+            "PYTHONHASHSEED": SUBPROCESS_HASH_SEED,
+            "PYTHONPATH": os.pathsep.join(
+                [PACKAGE_ROOT]
+                + [
+                    path
+                    for path in os.environ.get("PYTHONPATH", "").split(os.pathsep)
+                    if path
+                ]
+            ),
+        },
+        check=True,
+    )
+    return result.stdout.decode()
+
+
+def check_determinism(
+    obfuscator: Obfuscator, source_code: str, workers: int = 2
+) -> Dict[str, str]:
+    """Obfuscate the source code in several ways and hash the outputs.
+
+    Args:
+        obfuscator (Obfuscator): obfuscator to check, its cache is not used.
+        source_code (str): source code to obfuscate
+        workers (int, optional): number of worker processes of the parallel
+        run. Defaults to 2.
+
+    Returns:
+        Dict[str, str]: sha256 of the output of each run. The output is
+        deterministic if they are all equal.
+    """
+    uncached = copy.copy(obfuscator)
+    uncached.cache = None
+    digests = {}
+    for run in ("sequential #1", "sequential #2"):
+        digests[run] = output_digest(uncached.obfuscate(source_code))
+    with ParallelObfuscator(uncached, max(workers, 2), min_chunk_size=0) as engine:
+        digests[f"parallel x{engine.workers}"] = output_digest(
+            engine.obfuscate(source_code)
+        )
+    digests["fresh interpreter"] = output_digest(
+        _obfuscate_in_subprocess(uncached, source_code)
+    )
+    return digests
+
+
+def main() -> None:  # pragma: no cover (runs in a subprocess)
+    """Obfuscate the pickled (obfuscator, source code) read from stdin and
+    write the output to stdout."""
+    obfuscator, source_code = pickle.load(sys.stdin.buffer)
+    sys.stdout.buffer.write(obfuscator.obfuscate(source_code).encode())
+
+
+if __name__ == "__main__":
+    main()  # pragma: no cover
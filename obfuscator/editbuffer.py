@@ -0,0 +1,223 @@
+"""Piece table used to record edits on source code.
+
+Techniques emit `Edit` into an `EditBuffer` instead of building a new string for
+each substitution. Unchanged text is never copied: the buffer only keeps a list
+of pieces pointing either to the original source or to inserted text, and the
+final string is materialized once, when requested.
+
+"""
+import hashlib
+import random
+from typing import Any, Iterable, List, NamedTuple, Optional, Set
+
+from obfuscator import ctools
+from obfuscator.sourceindex import SourceIndex
+
+
+class Edit(NamedTuple):
+    """Replace the text between `start` and `end` by `text`.
+
+    Offsets are expressed in the current (logical) text of the buffer. An
+    insertion is an edit where `start == end`.
+    """
+
+    start: int
+    end: int
+    text: str
+
+
+class Piece(NamedTuple):
+    """Slice `[start:start + length]` of one of the buffer strings."""
+
+    buffer: int
+    start: int
+    length: int
+
+
+class EditBuffer:
+    """Piece table over a source code.
+
+    Attributes:
+        edit_count (int): number of edits applied so far.
+        defer_libs (bool): whether `insert_lib` should only record the lib in
+        `pending_libs` until `flush_libs` is called. Used when only a region
+        of the source is edited and offsets must remain stable.
+        pending_libs (List[str]): libs waiting to be inserted.
+        seed (int): seed of the random generators of the substitutions.
+
+    """
+
+    def __init__(self, source: str, defer_libs: bool = False, seed: int = 0):
+        self._buffers: List[str] = [source]
+        self._pieces: Optional[List[Piece]] = None
+        self._text: Optional[str] = source
+        self._length: Optional[int] = None
+        self._includes: Optional[Set[str]] = None
+        self._index: Optional[SourceIndex] = None
+        self.edit_count = 0
+        self.defer_libs = defer_libs
+        self.pending_libs: List[str] = []
+        self.seed = seed
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self._length = sum(piece.length for piece in self._get_pieces())
+        return self._length
+
+    def __str__(self) -> str:
+        return self.text()
+
+    def _get_pieces(self) -> List[Piece]:
+        if self._pieces is None:
+            self._pieces = [Piece(0, 0, len(self._buffers[0]))]
+        return self._pieces
+
+    def text(self) -> str:
+        """Materialize the current text. The result is cached until the next
+        edit, and becomes the single piece of the buffer: the next `apply`
+        only walks the pieces created by its own edits, instead of all the
+        pieces accumulated since the source was loaded.
+
+        Returns:
+            str: current source code
+        """
+        if self._text is None:
+            self._text = "".join(
+                self._buffers[piece.buffer][piece.start : piece.start + piece.length]
+                for piece in self._pieces
+            )
+            self._buffers = [self._text]
+            self._pieces = None
+        return self._text
+
+    def index(self) -> SourceIndex:
+        """Index of the current text, cached until the next edit.
+
+        Returns:
+            SourceIndex: index of the current source code
+        """
+        if self._index is None or self._index.source is not self.text():
+            self._index = SourceIndex(self.text())
+        return self._index
+
+    def random(self, *key: Any) -> random.Random:
+        """Random generator of a substitution, derived from the seed and the
+        key (ex: technique name and matched text) only. Randomized techniques
+        thus produce the same output whatever the position of the substitution,
+        the chunking of the source code or the order of execution.
+
+        Args:
+            key (Any): values identifying the substitution, with a stable repr.
+
+        Returns:
+            random.Random: random generator
+        """
+        digest = hashlib.sha256(repr((self.seed,) + key).encode()).digest()
+        return random.Random(int.from_bytes(digest, "big"))
+
+    def _add_piece(self, text: str) -> Piece:
+        self._buffers.append(text)
+        return Piece(len(self._buffers) - 1, 0, len(text))
+
+    def apply(self, edits: Iterable[Edit]) -> int:
+        """Apply a batch of edits in a single walk over the pieces.
+
+        Args:
+            edits (Iterable[Edit]): non overlapping edits, expressed in the
+            current text coordinates.
+
+        Raises:
+            ValueError: if two edits overlap.
+
+        Returns:
+            int: number of applied edits
+        """
+        edits = sorted(edits, key=lambda edit: (edit.start, edit.end))
+        if not edits:
+            return 0
+        for previous, edit in zip(edits, edits[1:]):
+            if edit.start < previous.end:
+                raise ValueError(f"Overlapping edits ({previous}) and ({edit})")
+
+        new_pieces = []
+        index = 0
+        cursor = 0
+        position = 0
+        for piece in self._get_pieces():
+            piece_end = position + piece.length
+            cursor = max(cursor, position)
+            while cursor < piece_end:
+                if index < len(edits) and edits[index].start < piece_end:
+                    edit = edits[index]
+                    if edit.start > cursor:
+                        new_pieces.append(
+                            Piece(
+                                piece.buffer,
+                                piece.start + cursor - position,
+                                edit.start - cursor,
+                            )
+                        )
+                    if edit.text:
+                        new_pieces.append(self._add_piece(edit.text))
+                    cursor = max(cursor, edit.end)
+                    index += 1
+                else:
+                    new_pieces.append(
+                        Piece(
+                            piece.buffer,
+                            piece.start + cursor - position,
+                            piece_end - cursor,
+                        )
+                    )
+                    cursor = piece_end
+            position = piece_end
+        # Insertions at the very end of the text
+        for edit in edits[index:]:
+            if edit.text:
+                new_pieces.append(self._add_piece(edit.text))
+
+        self._pieces = new_pieces
+        self._text = None
+        self._length = None
+        self.edit_count += len(edits)
+        return len(edits)
+
+    def insert(self, position: int, text: str) -> None:
+        """Insert text at the given position.
+
+        Args:
+            position (int): position in the current text
+            text (str): text to insert
+        """
+        self.apply([Edit(position, position, text)])
+
+    def insert_lib(self, lib: str) -> None:
+        """Buffer counterpart of `ctools.insert_lib`: prepend an include
+        statement for the lib if not already present.
+
+        Includes are only looked up in the text the first time, techniques
+        are not expected to edit include statements.
+
+        Args:
+            lib (str): library name. Will be used as is.
+        """
+        if self.defer_libs:
+            if lib not in self.pending_libs:
+                self.pending_libs.append(lib)
+            return
+        self._insert_lib(lib)
+
+    def flush_libs(self) -> None:
+        """Insert the libs recorded while `defer_libs` was set, in the order
+        they were requested."""
+        for lib in self.pending_libs:
+            self._insert_lib(lib)
+        self.pending_libs = []
+
+    def _insert_lib(self, lib: str) -> None:
+        if self._includes is None:
+            self._includes = set(ctools.get_includes(self.text()))
+        if lib in self._includes:
+            return
+        self.insert(0, f"{ctools.generate_include_lib_str(lib)}\n")
+        self._includes.add(lib)
@@ -0,0 +1,239 @@
+"""Expression-level rewriting of addition chains.
+
+`ReplaceAdditionTechnique` rewrites additions pair by pair. This module parses
+whole chains (ex: 'a + b + c + d') and rewrites them as a balanced tree of
+`(-(-L + (-R)))` nodes, so that the nesting only grows with the logarithm of the
+number of terms. The nesting depth and the size expansion of each chain are
+bounded: nodes beyond the limits are kept as plain additions.
+
+"""
+
+import re
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# A chain of at least two terms (identifiers or integer literals)
+CHAIN_PATTERN = re.compile(r"\b\w+(?:\s*\+\s*\w+)+")
+TERM_PATTERN = re.compile(r"\w+")
+# Characters allowed around a chain so that its additions are not bound to a
+# higher precedence operator (ex: 'x - a + b' or 'a + b * c').
+PRECEDING_CHARACTERS = "=(,;{}[?:"
+FOLLOWING_CHARACTERS = ";),]?:"
+# Characters added by rewriting a node, compared to ' + '
+NODE_OVERHEAD = len("(-(-") + len(" + (-") + len(")))") - len(" + ")
+
+
+class AdditionChain(NamedTuple):
+    """Addition chain found in the source code.
+
+    Attributes:
+        start (int): start of the chain
+        end (int): end of the chain
+        terms (List[str]): added terms, in order
+    """
+
+    start: int
+    end: int
+    terms: List[str]
+
+
+class RewriteStats(NamedTuple):
+    """Statistics of a rewrite.
+
+    Attributes:
+        chains (int): number of rewritten chains
+        terms (int): number of terms in the rewritten chains
+        nodes (int): number of rewritten additions
+        max_depth (int): deepest nesting of rewritten additions
+        input_length (int): size of the rewritten chains before rewriting
+        output_length (int): size of the rewritten chains after rewriting
+    """
+
+    chains: int = 0
+    terms: int = 0
+    nodes: int = 0
+    max_depth: int = 0
+    input_length: int = 0
+    output_length: int = 0
+
+    @property
+    def growth(self) -> float:
+        """Size ratio of the rewritten chains."""
+        return self.output_length / max(self.input_length, 1)
+
+    def __add__(self, other: "RewriteStats") -> "RewriteStats":
+        return RewriteStats(
+            self.chains + other.chains,
+            self.terms + other.terms,
+            self.nodes + other.nodes,
+            max(self.max_depth, other.max_depth),
+            self.input_length + other.input_length,
+            self.output_length + other.output_length,
+        )
+
+
+def _is_float_exponent(term: str) -> bool:
+    """Whether the term is the mantissa of a literal such as '1e+5'."""
+    return term[0].isdigit() and term[-1] in "eEpP"
+
+
+def chain_matches(
+    source: str, start: int = 0, end: Optional[int] = None
+) -> Iterator[re.Match]:
+    """Iterate over the addition chains that can be rewritten without changing
+    the precedence of the surrounding operators.
+
+    Args:
+        source (str): source code
+        start (int, optional): start of the region to search. Defaults to 0.
+        end (Optional[int], optional): end of the region to search. Defaults
+        to None (end of the source code).
+
+    Returns:
+        Iterator[re.Match]: chain matches, in source order.
+    """
+    end = len(source) if end is None else end
+    for match in CHAIN_PATTERN.finditer(source, start, end):
+        before = match.start()
+        while before > 0 and source[before - 1].isspace():
+            before -= 1
+        after = match.end()
+        while after < end and source[after].isspace():
+            after += 1
+        if before > 0 and source[before - 1] not in PRECEDING_CHARACTERS:
+            if not source.endswith("return", 0, before):
+                continue
+        if after < end and source[after] not in FOLLOWING_CHARACTERS:
+            continue
+        terms = TERM_PATTERN.findall(match.group())
+        if any(_is_float_exponent(term) for term in terms[:-1]):
+            continue
+        yield match
+
+
+def find_addition_chains(
+    source: str, start: int = 0, end: Optional[int] = None
+) -> List[AdditionChain]:
+    """Find the addition chains that can be rewritten (see `chain_matches`).
+
+    Args:
+        source (str): source code
+        start (int, optional): start of the region to search. Defaults to 0.
+        end (Optional[int], optional): end of the region to search. Defaults
+        to None (end of the source code).
+
+    Returns:
+        List[AdditionChain]: chains, in source order.
+    """
+    return [
+        AdditionChain(match.start(), match.end(), TERM_PATTERN.findall(match.group()))
+        for match in chain_matches(source, start, end)
+    ]
+
+
+def _select_nodes(
+    terms: int, max_depth: int, budget: int
+) -> Tuple[List[Tuple[int, int]], int]:
+    """Select the nodes of the balanced tree to rewrite, top levels first,
+    within the depth limit and the character budget.
+
+    Args:
+        terms (int): number of terms
+        max_depth (int): maximum number of nested rewritten levels
+        budget (int): maximum number of added characters
+
+    Returns:
+        Tuple[List[Tuple[int, int]], int]: (low, high) term ranges of the
+        selected nodes, and the depth reached.
+    """
+    selected = []
+    depth = 0
+    level = [(0, terms)]
+    while level and depth < max_depth:
+        next_level = []
+        for low, high in level:
+            if high - low < 2:
+                continue
+            # Compound operands have to be wrapped in parentheses
+            cost = NODE_OVERHEAD + 2 * ((high - low) > 2)
+            if cost > budget:
+                return selected, depth + bool(next_level)
+            budget -= cost
+            selected.append((low, high))
+            middle = (low + high + 1) // 2
+            next_level.extend([(low, middle), (middle, high)])
+        depth += bool(next_level)
+        level = next_level
+    return selected, depth
+
+
+def _emit(terms: List[str], low: int, high: int, rewritten) -> Tuple[str, bool]:
+    """Emit the expression of terms[low:high], and whether it is atomic (can be
+    negated without parentheses)."""
+    if high - low == 1:
+        return terms[low], True
+    if (low, high) not in rewritten:
+        return " + ".join(terms[low:high]), False
+    middle = (low + high + 1) // 2
+    left, left_atomic = _emit(terms, low, middle, rewritten)
+    right, right_atomic = _emit(terms, middle, high, rewritten)
+    left = left if left_atomic else f"({left})"
+    right = right if right_atomic else f"({right})"
+    return f"(-(-{left} + (-{right})))", True
+
+
+def rewrite_chain(
+    chain: AdditionChain, max_depth: int = 4, max_expansion: float = 3.0
+) -> Tuple[str, RewriteStats]:
+    """Rewrite an addition chain as a balanced tree of `(-(-L + (-R)))`.
+
+    Args:
+        chain (AdditionChain): chain to rewrite
+        max_depth (int, optional): maximum nesting of rewritten additions.
+        Defaults to 4.
+        max_expansion (float, optional): maximum size ratio of the rewritten
+        chain. Defaults to 3.0.
+
+    Returns:
+        Tuple[str, RewriteStats]: rewritten chain and its statistics.
+    """
+    input_length = chain.end - chain.start
+    plain_length = len(" + ".join(chain.terms))
+    budget = int(max_expansion * input_length) - plain_length
+    nodes, depth = _select_nodes(len(chain.terms), max_depth, budget)
+    rewritten, _ = _emit(chain.terms, 0, len(chain.terms), set(nodes))
+    stats = RewriteStats(
+        chains=1,
+        terms=len(chain.terms),
+        nodes=len(nodes),
+        max_depth=depth,
+        input_length=input_length,
+        output_length=len(rewritten),
+    )
+    return rewritten, stats
+
+
+def rewrite_additions(
+    source: str, max_depth: int = 4, max_expansion: float = 3.0
+) -> Tuple[str, RewriteStats]:
+    """Rewrite every addition chain of the source code.
+
+    Args:
+        source (str): source code
+        max_depth (int, optional): maximum nesting of rewritten additions.
+        Defaults to 4.
+        max_expansion (float, optional): maximum size ratio of each rewritten
+        chain. Defaults to 3.0.
+
+    Returns:
+        Tuple[str, RewriteStats]: rewritten source code and statistics.
+    """
+    parts = []
+    stats = RewriteStats()
+    position = 0
+    for chain in find_addition_chains(source):
+        rewritten, chain_stats = rewrite_chain(chain, max_depth, max_expansion)
+        parts.extend([source[position : chain.start], rewritten])
+        stats += chain_stats
+        position = chain.end
+    parts.append(source[position:])
+    return "".join(parts), stats
@@ -0,0 +1,284 @@
+"""Per-file time and memory budgets with graceful degradation.
+
+Some inputs make the regex techniques or the C parser blow up in time or
+memory. The `ResourceGovernor` runs the obfuscation (or the parser) of a file in
+a forked process, whose wall time and resident memory are sampled by the
+calling process: this works even while a regex holds the GIL. The process leads
+its own process group, so that it can start worker processes (see
+`ParallelObfuscator`), which are accounted in its memory. When a budget is
+exceeded the whole group is killed and the file is obfuscated again with a cheaper
+obfuscator (`FALLBACKS`), down to the passthrough one. Every degradation is
+recorded, and appended as a JSON line to the degradation log if one is set.
+
+Memory is measured as the resident set size growth of the process and its
+descendants, read from `/proc` (the memory budget is not enforced on other
+platforms).
+
+"""
+
+import json
+import multiprocessing
+import os
+import pathlib
+import signal
+import time
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from obfuscator import HarderToRead, Obfuscator, PassthroughObfuscator
+
+# Cheaper obfuscators to fall back to, in order. The last one is run without
+# budget and must not fail.
+FALLBACKS = [HarderToRead, PassthroughObfuscator]
+SAMPLE_INTERVAL = 0.01
+
+
+class BudgetExceededError(RuntimeError):
+    """A run exceeded its time or memory budget and was killed.
+
+    Attributes:
+        reason (str): exceeded budget, "time" or "memory"
+        elapsed (float): wall time of the run, in seconds
+        memory (int): peak resident memory growth of the run, in bytes
+    """
+
+    def __init__(self, reason: str, elapsed: float, memory: int):
+        super().__init__(
+            f"Exceeded {reason} budget after ({elapsed:.2f}s) using ({memory}) bytes"
+        )
+        self.reason = reason
+        self.elapsed = elapsed
+        self.memory = memory
+
+
+class Degradation(NamedTuple):
+    """Obfuscation of a file degraded to a cheaper obfuscator.
+
+    Attributes:
+        file (str): name of the obfuscated file
+        requested (str): obfuscator that exceeded the budget
+        fallback (str): obfuscator tried instead
+        reason (str): exceeded budget, "time" or "memory"
+        elapsed (float): wall time of the killed run, in seconds
+        memory (int): peak resident memory growth of the killed run, in bytes
+        time_budget (Optional[float]): time budget, in seconds
+        memory_budget (Optional[int]): memory budget, in bytes
+    """
+
+    file: str
+    requested: str
+    fallback: str
+    reason: str
+    elapsed: float
+    memory: int
+    time_budget: Optional[float]
+    memory_budget: Optional[int]
+
+
+def _resident_memory(pid: int) -> Optional[int]:
+    """Resident set size of a process in bytes, None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _descendants(pid: int) -> List[int]:
+    """Processes started by a process, recursively, read from `/proc` (empty
+    if unavailable)."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as children:
+            pids = [int(child) for child in children.read().split()]
+    except (OSError, ValueError):
+        return []
+    return pids + [descendant for child in pids for descendant in _descendants(child)]
+
+
+def _group_resident_memory(pid: int) -> Optional[int]:
+    """Resident set size of a process and its descendants in bytes, None if
+    unavailable."""
+    memory = _resident_memory(pid)
+    if memory is None:
+        return None
+    return memory + sum(
+        _resident_memory(descendant) or 0 for descendant in _descendants(pid)
+    )
+
+
+def _kill_group(process) -> None:
+    """Kill a process and the process group it leads."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # The process did not create its group yet
+        process.kill()
+
+
+def _child(connection, function: Callable, args) -> None:  # pragma: no cover
+    """Run the function in the forked process, leading a new process group,
+    and send back its result."""
+    os.setpgid(0, 0)
+    try:
+        connection.send(("ok", function(*args)))
+    except Exception as error:  # pylint: disable=broad-except
+        connection.send(("error", error))
+
+
+def _obfuscate(obfuscator: Obfuscator, source_code: str) -> str:
+    """Obfuscate without cache (looked up by the calling process), then stop
+    the worker processes the obfuscator may have started."""
+    try:
+        return obfuscator._obfuscate(source_code)  # pylint: disable=protected-access
+    finally:
+        close = getattr(obfuscator, "close", None)
+        if close is not None:
+            close()
+
+
+class ResourceGovernor:
+    """Enforce time and memory budgets on the processing of each file.
+
+    Attributes:
+        time_budget (Optional[float]): wall time budget per file, in seconds.
+        None for unlimited.
+        memory_budget (Optional[int]): resident memory budget per file, in
+        bytes. None for unlimited.
+        log_path (Optional[pathlib.Path]): JSON lines file the degradations are
+        appended to.
+        degradations (List[Degradation]): degradations, in order.
+    """
+
+    def __init__(
+        self,
+        time_budget: Optional[float] = None,
+        memory_budget: Optional[int] = None,
+        log_path: Optional[pathlib.Path] = None,
+    ):
+        self.time_budget = time_budget
+        self.memory_budget = memory_budget
+        self.log_path = log_path
+        self.degradations: List[Degradation] = []
+        self._context = multiprocessing.get_context("fork")
+
+    def run(self, function: Callable, *args: Any) -> Any:
+        """Run a function in a forked process within the budgets.
+
+        Args:
+            function (Callable): function to run, its result must be picklable.
+
+        Raises:
+            BudgetExceededError: if the run exceeded a budget
+            RuntimeError: if the process died without a result
+            Exception: exception raised by the function
+
+        Returns:
+            Any: function result
+        """
+        parent_connection, child_connection = self._context.Pipe(duplex=False)
+        # Not a daemon, so that the function can start worker processes
+        process = self._context.Process(
+            target=_child, args=(child_connection, function, args)
+        )
+        start = time.monotonic()
+        process.start()
+        child_connection.close()
+        baseline = _resident_memory(process.pid)
+        peak = 0
+        try:
+            while not parent_connection.poll(SAMPLE_INTERVAL):
+                elapsed = time.monotonic() - start
+                resident = _group_resident_memory(process.pid)
+                if resident is not None and baseline is not None:
+                    peak = max(peak, resident - baseline)
+                reason = None
+                if self.time_budget is not None and elapsed > self.time_budget:
+                    reason = "time"
+                elif self.memory_budget is not None and peak > self.memory_budget:
+                    reason = "memory"
+                if reason is not None:
+                    raise BudgetExceededError(reason, elapsed, peak)
+            try:
+                status, value = parent_connection.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError(
+                    f"Process died with exit code ({process.exitcode})"
+                ) from None
+        except BaseException:
+            _kill_group(process)
+            raise
+        finally:
+            process.join()
+            parent_connection.close()
+        if status == "error":
+            raise value
+        return value
+
+    def obfuscate(
+        self, obfuscator: Obfuscator, source_code: str, name: str = "<source>"
+    ) -> str:
+        """Obfuscate the source code within the budgets, falling back to
+        cheaper obfuscators when a budget is exceeded. Cached results are
+        looked up and stored in the calling process.
+
+        Args:
+            obfuscator (Obfuscator): requested obfuscator
+            source_code (str): source code to obfuscate
+            name (str, optional): file name, for the degradation log.
+            Defaults to "<source>".
+
+        Returns:
+            str: obfuscated source code
+        """
+        candidates = [obfuscator] + [
+            fallback(cache=obfuscator.cache, seed=obfuscator.seed)
+            for fallback in FALLBACKS
+            if not isinstance(obfuscator, fallback)
+        ]
+        for candidate, fallback in zip(candidates, candidates[1:]):
+            try:
+                return self._obfuscate_cached(candidate, source_code, governed=True)
+            except BudgetExceededError as error:
+                self._degrade(name, candidate, fallback, error)
+        return self._obfuscate_cached(candidates[-1], source_code, governed=False)
+
+    def _obfuscate_cached(
+        self, obfuscator: Obfuscator, source_code: str, governed: bool
+    ) -> str:
+        cache = obfuscator.cache
+        if cache is None:
+            key = None
+        else:
+            key = cache.key(source_code, obfuscator.fingerprint())
+            obfuscated = cache.get(key)
+            if obfuscated is not None:
+                return obfuscated
+        if governed:
+            obfuscated = self.run(_obfuscate, obfuscator, source_code)
+        else:
+            obfuscated = _obfuscate(obfuscator, source_code)
+        if cache is not None:
+            cache.put(key, obfuscated)
+        return obfuscated
+
+    def _degrade(
+        self,
+        name: str,
+        requested: Obfuscator,
+        fallback: Obfuscator,
+        error: BudgetExceededError,
+    ) -> None:
+        degradation = Degradation(
+            file=name,
+            requested=type(requested).__name__,
+            fallback=type(fallback).__name__,
+            reason=error.reason,
+            elapsed=round(error.elapsed, 3),
+            memory=error.memory,
+            time_budget=self.time_budget,
+            memory_budget=self.memory_budget,
+        )
+        self.degradations.append(degradation)
+        if self.log_path is not None:
+            with open(self.log_path, "a") as log:
+                log.write(json.dumps(degradation._asdict()) + "\n")
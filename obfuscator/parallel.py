@@ -0,0 +1,152 @@
+"""Intra-file parallelism.
+
+A single huge translation unit is obfuscated on a single core by
+`Obfuscator.obfuscate`. The `ParallelObfuscator` splits the source code at
+top-level function boundaries, obfuscates the chunks in worker processes and
+reassembles them in order.
+
+The obfuscation is run stage by stage (see `Obfuscator.stages`). Chunks are
+edited with deferred libs, so that file-level effects such as the 'stdlib.h'
+include of `ReplaceSingleAdditionTechnique` are deduplicated and inserted once
+in the reassembled source code. Stages that are not chunk safe run on the whole
+source code. The output is identical to the sequential run.
+
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from obfuscator import Obfuscator, ctools
+from obfuscator.editbuffer import EditBuffer
+
+# Characters after which a chunk can end: a regex match of a technique never
+# spans them and the next definition.
+CHUNK_END_CHARACTERS = ";}"
+
+
+def split_functions(source: str) -> List[int]:
+    """Offsets where the source code can be split so that each chunk, but
+    the one preceding the first function, starts with a top-level function
+    definition.
+
+    Args:
+        source (str): source code
+
+    Returns:
+        List[int]: split offsets, in increasing order, excluding 0.
+    """
+    offsets = []
+    for signature in ctools.scan_function_signatures(source):
+        start = signature.start
+        if start == 0:
+            continue
+        previous = source[start - 1]
+        if previous.isspace() or previous in CHUNK_END_CHARACTERS:
+            offsets.append(start)
+    return offsets
+
+
+def split_source(source: str, chunks: int, min_chunk_size: int = 0) -> List[str]:
+    """Split the source code at function boundaries into at most `chunks`
+    chunks of similar sizes.
+
+    Args:
+        source (str): source code
+        chunks (int): maximum number of chunks
+        min_chunk_size (int, optional): minimum size of a chunk. Defaults to 0.
+
+    Returns:
+        List[str]: chunks, in order. Joined, they are the source code.
+    """
+    target = max(len(source) // max(chunks, 1), min_chunk_size, 1)
+    parts = []
+    start = 0
+    for offset in split_functions(source):
+        if offset - start >= target and len(source) - offset >= min_chunk_size:
+            parts.append(source[start:offset])
+            start = offset
+    parts.append(source[start:])
+    return parts
+
+
+def _edit_chunk(stage: Obfuscator, chunk: str) -> Tuple[str, List[str]]:
+    """Obfuscate a chunk in a worker. Libs are returned instead of inserted."""
+    buffer = EditBuffer(chunk, defer_libs=True, seed=stage.seed)
+    stage.edit(buffer)
+    return buffer.text(), buffer.pending_libs
+
+
+class ParallelObfuscator(Obfuscator):
+    """Obfuscate the top-level functions of the source code in parallel, with
+    the same result as the wrapped obfuscator.
+
+    Attributes:
+        obfuscator (Obfuscator): wrapped obfuscator
+        workers (int): number of worker processes
+        min_chunk_size (int): sources are not split in chunks smaller than this
+        size, as the process overhead would outweigh the gain.
+        chunks_per_worker (int): number of chunks per worker, more chunks
+        balancing the load of uneven functions.
+    """
+
+    def __init__(
+        self,
+        obfuscator: Obfuscator,
+        workers: int = None,
+        min_chunk_size: int = 16 * 1024,
+        chunks_per_worker: int = 4,
+    ):
+        super().__init__(obfuscator.techniques, obfuscator.cache, obfuscator.seed)
+        self.obfuscator = obfuscator
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chunk_size = min_chunk_size
+        self.chunks_per_worker = chunks_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def fingerprint(self) -> str:
+        """Same as the wrapped obfuscator, as the results are identical."""
+        return self.obfuscator.fingerprint()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("fork")
+            )
+        return self._executor
+
+    def _obfuscate(self, source_code: str) -> str:
+        text = source_code
+        for stage, chunk_safe in self.obfuscator.stages():
+            chunks = [text]
+            if chunk_safe and self.workers > 1:
+                chunks = split_source(
+                    text, self.workers * self.chunks_per_worker, self.min_chunk_size
+                )
+            if len(chunks) < 2:
+                text = stage._obfuscate(text)  # pylint: disable=protected-access
+                continue
+            results = list(
+                self._get_executor().map(_edit_chunk, [stage] * len(chunks), chunks)
+            )
+            joined = "".join(text for text, _ in results)
+            buffer = EditBuffer(joined, defer_libs=True)
+            for _, libs in results:
+                for lib in libs:
+                    buffer.insert_lib(lib)
+            buffer.flush_libs()
+            text = buffer.text()
+        return text
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> "ParallelObfuscator":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
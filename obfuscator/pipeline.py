@@ -0,0 +1,138 @@
+"""Shared-prefix execution of several technique chains.
+
+Evaluating many obfuscation configurations against one source code runs the
+same techniques again and again: chains such as `[A, B]` and `[A, B, C]` share
+the result of `[A, B]`. The `PipelineExecutor` arranges the chains in a prefix
+tree, applies each technique once per distinct prefix, and keeps the
+intermediate results (optionally in an `ObfuscationCache`). The resulting
+variants are compiled in parallel into a single shared `ctools.Runner`,
+identical variants being compiled once, and then run.
+
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from obfuscator import __version__, ctools
+from obfuscator.cache import ObfuscationCache, fingerprint
+from obfuscator.editbuffer import EditBuffer
+from obfuscator.techniques import Technique
+
+
+class PipelineExecutor:
+    """Apply technique chains sharing their common prefixes.
+
+    Attributes:
+        chains (Dict[str, Sequence[Technique]]): technique chain of each
+        variant, applied in order.
+        cache (Optional[ObfuscationCache]): cache of the intermediate results.
+        seed (int): seed of the randomized techniques.
+        passes (int): number of technique passes run so far.
+    """
+
+    def __init__(
+        self,
+        chains: Dict[str, Sequence[Technique]],
+        cache: Optional[ObfuscationCache] = None,
+        seed: int = 0,
+    ):
+        self.chains = chains
+        self.cache = cache
+        self.seed = seed
+        self.passes = 0
+
+    def _apply(self, technique: Technique, source_code: str, prefix: Tuple) -> str:
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(
+                source_code, fingerprint(prefix, __version__, "pipeline", self.seed)
+            )
+            obfuscated = self.cache.get(key)
+            if obfuscated is not None:
+                return obfuscated
+        buffer = EditBuffer(source_code, seed=self.seed)
+        technique.edit(buffer)
+        self.passes += 1
+        if self.cache is not None:
+            self.cache.put(key, buffer.text())
+        return buffer.text()
+
+    def obfuscate(self, source_code: str) -> Dict[str, str]:
+        """Obfuscate the source code with every chain, each distinct chain
+        prefix being applied once.
+
+        Args:
+            source_code (str): source code to obfuscate
+
+        Returns:
+            Dict[str, str]: obfuscated source code of each variant.
+        """
+        results: Dict[Tuple, str] = {(): source_code}
+        for chain in self.chains.values():
+            prefix: Tuple = ()
+            for technique in chain:
+                node = prefix + (technique,)
+                if node not in results:
+                    results[node] = self._apply(technique, results[prefix], node)
+                prefix = node
+        return {name: results[tuple(chain)] for name, chain in self.chains.items()}
+
+    @staticmethod
+    def compile(
+        variants: Dict[str, str], runner: ctools.Runner, workers: int = None
+    ) -> Dict[str, Tuple[str, List[str]]]:
+        """Compile the variants in parallel into the runner, identical variants
+        being compiled once.
+
+        Args:
+            variants (Dict[str, str]): source code of each variant
+            runner (ctools.Runner): shared runner
+            workers (int, optional): number of compilation processes. Defaults
+            to the number of CPUs.
+
+        Returns:
+            Dict[str, Tuple[str, List[str]]]: module name and function names of
+            each variant.
+        """
+        # Module names must not conflict with the runner previous builds
+        prefix = f"variant_{len(runner.compiled_modules)}"
+        modules: Dict[str, str] = {}
+        for source in variants.values():
+            if source not in modules:
+                modules[source] = f"{prefix}_{len(modules)}"
+        function_names = runner.compile_sources(
+            {module: source for source, module in modules.items()}, workers
+        )
+        return {
+            name: (modules[source], function_names[modules[source]])
+            for name, source in variants.items()
+        }
+
+    @classmethod
+    def compile_and_run(
+        cls,
+        variants: Dict[str, str],
+        runner: ctools.Runner,
+        *args: Any,
+        function_name: str = None,
+        workers: int = None,
+    ) -> Dict[str, Any]:
+        """Compile the variants (see `compile`) and run a function of each of
+        them with the same arguments.
+
+        Args:
+            variants (Dict[str, str]): source code of each variant
+            runner (ctools.Runner): shared runner
+            function_name (str, optional): function to run. Defaults to the
+            first function of each variant.
+            workers (int, optional): number of compilation processes. Defaults
+            to the number of CPUs.
+
+        Returns:
+            Dict[str, Any]: function run result of each variant.
+        """
+        return {
+            name: runner.run(module, function_name or function_names[0], *args)
+            for name, (module, function_names) in cls.compile(
+                variants, runner, workers
+            ).items()
+        }
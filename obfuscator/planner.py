@@ -0,0 +1,318 @@
+"""Overhead-budgeted obfuscation planner.
+
+Instead of using a fixed list of techniques, the planner picks, for each
+function of the source code, the techniques to apply so that the estimated
+slowdown and the measured code growth of the function remain within the given
+budget.
+
+The slowdown is estimated with the `COST` declared by each technique: every
+substitution adds its instructions (a call counting as `CALL_INSTRUCTIONS`) to
+the function cost, weighted by `LOOP_WEIGHT` for each loop enclosing the
+substitution. Hot loops thus quickly exhaust the budget whereas cold paths can
+afford expensive techniques.
+
+"""
+
+import re
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from obfuscator import Obfuscator, ctools
+from obfuscator.cache import ObfuscationCache
+from obfuscator.editbuffer import EditBuffer
+from obfuscator.sourceindex import SourceIndex
+from obfuscator.techniques import (
+    RemoveSpacesTechnique,
+    ReplaceAdditionChainTechnique,
+    ReplaceAdditionTechnique,
+    ReplaceSingleAdditionConstantTechnique,
+    ReplaceSingleAdditionTechnique,
+    ReplaceXORTechnique,
+    Technique,
+)
+
+LOOP_WEIGHT = 10
+CALL_INSTRUCTIONS = 20
+LOOP_PATTERN = re.compile(r"\b(?:for|while|do)\b")
+OPERATION_PATTERN = re.compile(r"[-+*/%^&|<>=!~]+|;")
+SPACES_PATTERN = re.compile(r"\s*")
+
+# Candidate techniques, in the order they are applied.
+DEFAULT_TECHNIQUES = [
+    ReplaceAdditionTechnique,
+    ReplaceAdditionChainTechnique,
+    ReplaceSingleAdditionConstantTechnique,
+    ReplaceSingleAdditionTechnique,
+    ReplaceXORTechnique,
+    RemoveSpacesTechnique,
+]
+
+
+class FunctionPlan(NamedTuple):
+    """Techniques selected for a function.
+
+    Attributes:
+        name (str): function name
+        start (int): start of the function definition in the source code
+        end (int): end of the function definition in the source code
+        techniques (List[Technique]): techniques to apply, in order
+        slowdown (float): estimated slowdown of the obfuscated function
+        growth (float): size ratio of the obfuscated function
+    """
+
+    name: str
+    start: int
+    end: int
+    techniques: List[Technique]
+    slowdown: float
+    growth: float
+
+
+def _closing_index(source: str, position: int, opening: str, closing: str) -> int:
+    """Find the index after the bracket closing the one at `position`.
+
+    Args:
+        source (str): source code
+        position (int): index of the opening bracket
+        opening (str): opening bracket
+        closing (str): closing bracket
+
+    Returns:
+        int: index after the closing bracket, or the source length if unbalanced.
+    """
+    depth = 0
+    for index in range(position, len(source)):
+        if source[index] == opening:
+            depth += 1
+        elif source[index] == closing:
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return len(source)
+
+
+def function_spans(source: str) -> List[Tuple[str, int, int]]:
+    """Locate the function definitions of the source code.
+
+    Args:
+        source (str): source code
+
+    Returns:
+        List[Tuple[str, int, int]]: (name, start, end) of each function.
+    """
+    return [
+        (signature.name, signature.start, signature.body_end)
+        for signature in ctools.scan_function_signatures(source)
+    ]
+
+
+def loop_spans(source: str) -> List[Tuple[int, int]]:
+    """Locate the loops (`for`, `while` and `do`) of a function.
+
+    Args:
+        source (str): source code of a function
+
+    Returns:
+        List[Tuple[int, int]]: (start, end) of each loop.
+    """
+    spans = []
+    for match in LOOP_PATTERN.finditer(source):
+        position = match.end()
+        if match.group() != "do":
+            position = source.find("(", position)
+            if position < 0:
+                continue
+            position = _closing_index(source, position, "(", ")")
+        body = SPACES_PATTERN.match(source, position).end()
+        if source.startswith("{", body):
+            end = _closing_index(source, body, "{", "}")
+        else:
+            end = source.find(";", body) + 1 or len(source)
+        spans.append((match.start(), end))
+    return spans
+
+
+def loop_weight(position: int, loops: List[Tuple[int, int]]) -> int:
+    """Weight of a position depending on the number of enclosing loops."""
+    depth = sum(1 for start, end in loops if start <= position < end)
+    return LOOP_WEIGHT**depth
+
+
+def base_cost(source: str) -> float:
+    """Estimate the cost of a function as its number of operations and
+    statements, weighted by loops, plus the cost of calling it.
+
+    Args:
+        source (str): source code of a function
+
+    Returns:
+        float: estimated cost
+    """
+    loops = loop_spans(source)
+    cost = sum(
+        loop_weight(match.start(), loops)
+        for match in OPERATION_PATTERN.finditer(source)
+    )
+    return cost + CALL_INSTRUCTIONS
+
+
+def technique_cost(technique: Technique, source: str) -> float:
+    """Estimate the cost added by applying the technique to a function.
+
+    Args:
+        technique (Technique): technique to apply
+        source (str): source code of a function
+
+    Returns:
+        float: estimated extra cost
+    """
+    if not hasattr(technique, "matches"):
+        return 0
+    unit_cost = technique.COST.instructions + technique.COST.calls * CALL_INSTRUCTIONS
+    if not unit_cost:
+        return 0
+    loops = loop_spans(source)
+    return sum(
+        unit_cost * technique.substitutions(match) * loop_weight(match.start(), loops)
+        for match in technique.matches(source, index=SourceIndex(source))
+    )
+
+
+class Planner:
+    """Select techniques per function within a slowdown and growth budget.
+
+    Attributes:
+        max_slowdown (float): maximum estimated slowdown of a function
+        (ex: 1.2 for 20% slower).
+        max_growth (Optional[float]): maximum size ratio of a function, None for
+        unlimited growth.
+        techniques (List[Technique]): candidate techniques, in the order they
+        are applied.
+    """
+
+    def __init__(
+        self,
+        max_slowdown: float = 1.0,
+        max_growth: Optional[float] = None,
+        techniques: List[Technique] = None,
+    ):
+        self.max_slowdown = max_slowdown
+        self.max_growth = max_growth
+        self.techniques = DEFAULT_TECHNIQUES if techniques is None else techniques
+
+    def plan_function(self, source: str) -> Tuple[List[Technique], float, float]:
+        """Select the techniques for a single function. Every subset of the
+        candidate techniques (applied in order) is explored, the one with the
+        highest total `STRENGTH` within the budget is kept. Techniques that
+        do not substitute anything are never selected, and the estimated
+        slowdown only increases along a chain so exceeding branches are pruned.
+
+        Args:
+            source (str): source code of the function
+
+        Returns:
+            Tuple[List[Technique], float, float]: selected techniques,
+            estimated slowdown and growth.
+        """
+        base = base_cost(source)
+        size = max(len(source), 1)
+        best = (0, -1.0, [], 1.0, source)
+
+        def explore(index: int, current: str, extra: float, selected, strength):
+            nonlocal best
+            growth = len(current) / size
+            slowdown = (base + extra) / base
+            if self.max_growth is None or growth <= self.max_growth:
+                if (strength, -slowdown) > best[:2]:
+                    best = (strength, -slowdown, selected, slowdown, current)
+            for position in range(index, len(self.techniques)):
+                technique = self.techniques[position]
+                cost = technique_cost(technique, current)
+                if (base + extra + cost) / base > self.max_slowdown:
+                    continue
+                buffer = EditBuffer(current, defer_libs=True)
+                if not technique.edit(buffer):
+                    continue
+                explore(
+                    position + 1,
+                    buffer.text(),
+                    extra + cost,
+                    selected + [technique],
+                    strength + technique.STRENGTH,
+                )
+
+        explore(0, source, 0.0, [], 0)
+        _, _, selected, slowdown, obfuscated = best
+        return selected, slowdown, len(obfuscated) / size
+
+    def plan(self, source: str) -> List[FunctionPlan]:
+        """Plan the obfuscation of each function of the source code.
+
+        Args:
+            source (str): source code
+
+        Returns:
+            List[FunctionPlan]: plan of each function, in source order.
+        """
+        plans = []
+        for name, start, end in function_spans(source):
+            techniques, slowdown, growth = self.plan_function(source[start:end])
+            plans.append(FunctionPlan(name, start, end, techniques, slowdown, growth))
+        return plans
+
+
+class PlannedObfuscator(Obfuscator):
+    """Obfuscator applying, to each function, the techniques selected by a
+    `Planner`. Code outside of functions is left untouched."""
+
+    def __init__(
+        self,
+        planner: Planner,
+        cache: Optional[ObfuscationCache] = None,
+        seed: int = 0,
+    ):
+        super().__init__(planner.techniques, cache, seed)
+        self.planner = planner
+
+    def _parameters(self) -> List[Any]:
+        return super()._parameters() + [
+            self.planner.max_slowdown,
+            self.planner.max_growth,
+            LOOP_WEIGHT,
+            CALL_INSTRUCTIONS,
+        ]
+
+    def _obfuscate(self, source_code: str) -> str:
+        """Obfuscate each function with its planned techniques.
+
+        Args:
+            source_code (str): source code to obfuscate
+
+        Returns:
+            str: obfuscated source code
+        """
+        buffer = EditBuffer(source_code, defer_libs=True, seed=self.seed)
+        self.edit(buffer)
+        buffer.flush_libs()
+        return buffer.text()
+
+    def edit(self, buffer: EditBuffer) -> None:
+        """Apply the planned techniques to each function of the buffer.
+
+        Args:
+            buffer (EditBuffer): source code buffer, deferring libs.
+        """
+        # Last functions first so that the offsets of the others remain valid
+        for plan in reversed(self.planner.plan(buffer.text())):
+            end = plan.end
+            for technique in plan.techniques:
+                length = len(buffer)
+                technique.edit(buffer, plan.start, end)
+                end += len(buffer) - length
+
+    def stages(self) -> List[Tuple[Obfuscator, bool]]:
+        """Functions are planned independently and libs are only inserted at
+        the end: the whole obfuscation is a single stage."""
+        chunk_safe = all(
+            getattr(technique, "CHUNK_SAFE", False) for technique in self.techniques
+        )
+        return [(self, chunk_safe)]
@@ -0,0 +1,291 @@
+"""Pool of pre-forked worker processes running compiled C functions.
+
+Running obfuscated C code inside the calling interpreter means that a segfault
+or an infinite loop kills the whole verification. The `ExecutionPool` runs each
+call in a worker process instead: workers are forked once, keep the modules they
+loaded, and are respawned when they crash or exceed the call timeout. Failures
+are raised as `ExecutionError` subclasses.
+
+A pool is meant to be shared by several `ctools.Runner` (see its `pool`
+argument) and used as a context manager so that workers are stopped.
+
+Buffer arguments (see `ctools.is_buffer`) are copied to shared memory for the
+duration of the call, passed to the function as pointers to that memory, and
+copied back to the writable buffers once the call succeeded.
+
+"""
+
+import multiprocessing
+import os
+import queue
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from obfuscator import ctools
+
+
+class ExecutionError(RuntimeError):
+    """A call could not complete in a worker.
+
+    Attributes:
+        module (str): module name
+        funcname (str): function name
+    """
+
+    def __init__(self, message: str, module: str, funcname: str):
+        super().__init__(message)
+        self.module = module
+        self.funcname = funcname
+
+
+class CallTimeoutError(ExecutionError):
+    """The call exceeded its timeout. The worker was killed and respawned.
+
+    Attributes:
+        timeout (float): exceeded timeout, in seconds
+    """
+
+    def __init__(self, module: str, funcname: str, timeout: float):
+        super().__init__(
+            f"Call to ({module}.{funcname}) exceeded ({timeout}s)", module, funcname
+        )
+        self.timeout = timeout
+
+
+class WorkerCrashError(ExecutionError):
+    """The worker died during the call (ex: segmentation fault). It was
+    respawned.
+
+    Attributes:
+        exitcode (Optional[int]): exit code of the worker, negative for the
+        signal that killed it (ex: -11 for SIGSEGV).
+    """
+
+    def __init__(self, module: str, funcname: str, exitcode: Optional[int]):
+        super().__init__(
+            f"Worker crashed running ({module}.{funcname}), exit code ({exitcode})",
+            module,
+            funcname,
+        )
+        self.exitcode = exitcode
+
+
+class SharedBuffer(NamedTuple):
+    """Buffer argument copied to shared memory, as sent to a worker.
+
+    Attributes:
+        name (str): shared memory block name
+        size (int): size of the buffer, in bytes
+    """
+
+    name: str
+    size: int
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to a shared memory block owned by the calling process."""
+    try:
+        # Python >= 3.13: the owner alone unlinks the block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _call_with_buffers(function: Any, ffi: Any, args: Tuple[Any, ...]) -> Any:
+    """Call a function in a worker, passing the shared buffers as pointers."""
+    blocks = {
+        position: _attach(arg.name)
+        for position, arg in enumerate(args)
+        if isinstance(arg, SharedBuffer)
+    }
+    try:
+        if not blocks:
+            return function(*args)
+        views = [
+            blocks[position].buf[: arg.size] if position in blocks else arg
+            for position, arg in enumerate(args)
+        ]
+        pointers = ctools.buffer_arguments(ffi, function, views)
+        try:
+            return function(*pointers)
+        finally:
+            # Blocks cannot be closed while their memory is exported
+            del pointers
+            for view in views:
+                if isinstance(view, memoryview):
+                    view.release()
+    finally:
+        for block in blocks.values():
+            block.close()
+
+
+def _worker_loop(connection) -> None:  # pragma: no cover (runs in workers)
+    """Serve (path, module, funcname, args) requests until None is received.
+    Loaded modules are kept for the next calls."""
+    modules: Dict[str, Any] = {}
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        path, module, funcname, args = request
+        try:
+            if path not in modules:
+                modules[path] = ctools.load_module(module, path)
+            func = getattr(modules[path].lib, funcname, None)
+            result = None
+            if callable(func):
+                result = _call_with_buffers(func, modules[path].ffi, args)
+            connection.send(("ok", result))
+        except Exception as error:  # pylint: disable=broad-except
+            connection.send(("error", error))
+
+
+class _Worker(NamedTuple):
+    process: multiprocessing.Process
+    connection: Any
+
+
+class ExecutionPool:
+    """Pre-forked worker processes running compiled functions with a timeout.
+
+    Attributes:
+        workers (int): number of worker processes
+        timeout (float): default per-call timeout, in seconds
+        respawns (int): number of workers respawned after a crash or timeout,
+        or found dead before a call
+    """
+
+    def __init__(self, workers: int = None, timeout: float = 10.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.respawns = 0
+        self._context = multiprocessing.get_context("fork")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for _ in range(self.workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        parent_connection, child_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_loop, args=(child_connection,), daemon=True
+        )
+        process.start()
+        child_connection.close()
+        return _Worker(process, parent_connection)
+
+    def _respawn(self, worker: _Worker) -> _Worker:
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+        worker.connection.close()
+        self.respawns += 1
+        return self._spawn()
+
+    def call(
+        self,
+        path: str,
+        module: str,
+        funcname: str,
+        *args: Any,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Run a compiled function in a worker.
+
+        Args:
+            path (str): path of the compiled extension
+            module (str): module name
+            funcname (str): function name
+            timeout (Optional[float], optional): call timeout in seconds.
+            Defaults to the pool timeout.
+
+        Raises:
+            CallTimeoutError: if the call exceeded the timeout
+            WorkerCrashError: if the worker died during the call
+            Exception: exception raised by the call in the worker (ex: wrong
+            arguments)
+
+        Returns:
+            Any: function run result, None if the function does not exist.
+        """
+        shared: List[Tuple[memoryview, shared_memory.SharedMemory]] = []
+        try:
+            call_args = []
+            for arg in args:
+                if not ctools.is_buffer(arg):
+                    call_args.append(arg)
+                    continue
+                view = memoryview(arg).cast("B")
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(view.nbytes, 1)
+                )
+                shared.append((view, block))
+                block.buf[: view.nbytes] = view
+                call_args.append(SharedBuffer(block.name, view.nbytes))
+            result = self._call(path, module, funcname, call_args, timeout)
+            for view, block in shared:
+                if not view.readonly:
+                    view[:] = block.buf[: view.nbytes]
+            return result
+        finally:
+            for view, block in shared:
+                view.release()
+                block.close()
+                block.unlink()
+
+    def _call(
+        self,
+        path: str,
+        module: str,
+        funcname: str,
+        args: List[Any],
+        timeout: Optional[float],
+    ) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._idle.get()
+        try:
+            if not worker.process.is_alive():
+                # Died while idle (ex: killed), before this call
+                worker = self._respawn(worker)
+            try:
+                worker.connection.send((path, module, funcname, args))
+            except OSError:
+                worker = self._respawn(worker)
+                worker.connection.send((path, module, funcname, args))
+            if not worker.connection.poll(timeout):
+                worker = self._respawn(worker)
+                raise CallTimeoutError(module, funcname, timeout)
+            try:
+                status, value = worker.connection.recv()
+            except EOFError:
+                worker.process.join()
+                exitcode = worker.process.exitcode
+                worker = self._respawn(worker)
+                raise WorkerCrashError(module, funcname, exitcode) from None
+        finally:
+            self._idle.put(worker)
+        if status == "error":
+            raise value
+        return value
+
+    def close(self) -> None:
+        """Stop all the workers."""
+        while not self._idle.empty():
+            worker = self._idle.get()
+            try:
+                worker.connection.send(None)
+            except OSError:
+                pass
+            worker.process.join(timeout=1)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.connection.close()
+
+    def __enter__(self) -> "ExecutionPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,171 @@
+"""Index of a source code, used to skip or narrow technique passes.
+
+Most techniques can only match around a given operator (ex: `^` for
+`ReplaceXORTechnique`), which most files do not even contain. Techniques
+declare these characters as `TRIGGERS`: the index counts their occurrences,
+so that passes without any trigger are skipped, and locates the statements
+holding them, so that the other passes only search these regions.
+
+The offsets of the triggers and of the statement boundaries are listed once
+per index, regions are then found by bisection: locating them is linear in the
+source size, however dense the triggers are. When most statements hold a
+trigger, narrowing cannot save anything and techniques search the whole source
+code instead (see `NARROWING_MAX_DENSITY`).
+
+"""
+
+import bisect
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Characters delimiting statements
+STATEMENT_BOUNDARIES = ";{}"
+# Maximum number of trigger occurrences per statement for which techniques
+# search the statements holding them rather than the whole source code.
+NARROWING_MAX_DENSITY = 0.25
+BOUNDARY_PATTERN = re.compile(f"[{re.escape(STATEMENT_BOUNDARIES)}]")
+NEWLINE_PATTERN = re.compile(r"\n")
+
+
+class SourceIndex:
+    """Occurrence counts and line offsets of a source code, computed lazily.
+
+    Attributes:
+        source (str): indexed source code
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._counts: Dict[str, int] = {}
+        self._offsets: Dict[str, List[int]] = {}
+        self._line_offsets: Optional[List[int]] = None
+        self._boundaries: Optional[List[int]] = None
+
+    def count(self, symbol: str) -> int:
+        """Number of occurrences of a character or operator.
+
+        Args:
+            symbol (str): character or operator (ex: '^', '+=')
+
+        Returns:
+            int: number of non overlapping occurrences
+        """
+        if symbol not in self._counts:
+            self._counts[symbol] = self.source.count(symbol)
+        return self._counts[symbol]
+
+    def offsets(self, char: str) -> List[int]:
+        """Offsets of the occurrences of a character.
+
+        Args:
+            char (str): character
+
+        Returns:
+            List[int]: offsets, in increasing order
+        """
+        if char not in self._offsets:
+            self._offsets[char] = [
+                match.start() for match in re.finditer(re.escape(char), self.source)
+            ]
+        return self._offsets[char]
+
+    @property
+    def boundaries(self) -> List[int]:
+        """Offsets of the statement boundaries (see `STATEMENT_BOUNDARIES`)."""
+        if self._boundaries is None:
+            self._boundaries = [
+                match.start() for match in BOUNDARY_PATTERN.finditer(self.source)
+            ]
+        return self._boundaries
+
+    @property
+    def line_offsets(self) -> List[int]:
+        """Offset of the start of each line."""
+        if self._line_offsets is None:
+            self._line_offsets = [0] + [
+                match.end() for match in NEWLINE_PATTERN.finditer(self.source)
+            ]
+        return self._line_offsets
+
+    def line(self, position: int) -> int:
+        """Line number (starting at 1) of a position.
+
+        Args:
+            position (int): offset in the source code
+
+        Returns:
+            int: line number
+        """
+        return bisect.bisect_right(self.line_offsets, position)
+
+    def _statement(self, position: int, start: int, end: int) -> Tuple[int, int]:
+        """Bounds of the statement holding the position: from the previous
+        statement boundary (excluded) to the next one (included)."""
+        boundaries = self.boundaries
+        following = bisect.bisect_left(boundaries, position)
+        left = start - 1
+        if following > 0 and boundaries[following - 1] >= start:
+            left = boundaries[following - 1]
+        right = end - 1
+        if following < len(boundaries) and boundaries[following] < end:
+            right = boundaries[following]
+        return left + 1, right + 1
+
+    def regions(
+        self,
+        triggers: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        max_density: Optional[float] = None,
+    ) -> List[Tuple[int, int]]:
+        """Statements of `source[start:end]` holding one of the triggers.
+
+        A technique whose matches contain one of its triggers, and no
+        statement boundary but as their last character, finds the same
+        matches in these regions as in the whole source code.
+
+        Args:
+            triggers (str): trigger characters
+            start (int, optional): start of the searched region. Defaults to 0.
+            end (Optional[int], optional): end of the searched region. Defaults
+            to None (end of the source code).
+            max_density (Optional[float], optional): when there are more
+            trigger occurrences per statement, the whole searched region is
+            returned as a single region. Defaults to None (always narrow).
+
+        Returns:
+            List[Tuple[int, int]]: (start, end) of the non overlapping regions,
+            in order.
+        """
+        end = len(self.source) if end is None else end
+        offsets = [self.offsets(char) for char in triggers if self.count(char)]
+        occurrences = sum(
+            bisect.bisect_left(char_offsets, end)
+            - bisect.bisect_left(char_offsets, start)
+            for char_offsets in offsets
+        )
+        if not occurrences:
+            return []
+        if max_density is not None:
+            statements = bisect.bisect_left(self.boundaries, end) - bisect.bisect_left(
+                self.boundaries, start
+            )
+            if occurrences > max(statements, 1) * max_density:
+                return [(start, end)]
+        regions: List[Tuple[int, int]] = []
+        position = start
+        while offsets and position < end:
+            found = []
+            for char_offsets in offsets:
+                following = bisect.bisect_left(char_offsets, position)
+                if following < len(char_offsets) and char_offsets[following] < end:
+                    found.append(char_offsets[following])
+            if not found:
+                break
+            region_start, region_end = self._statement(min(found), start, end)
+            if regions and regions[-1][1] >= region_start:
+                regions[-1] = (regions[-1][0], region_end)
+            else:
+                regions.append((region_start, region_end))
+            position = region_end
+        return regions
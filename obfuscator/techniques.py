@@ -1,30 +1,84 @@
 """Obfuscation technique protocol and concrete implementation."""
 
+import bisect
+import itertools
 import re
 from abc import abstractmethod
-from typing import Protocol
+from typing import Dict, Iterator, NamedTuple, Optional, Protocol, Tuple
 
-from obfuscator import ctools
+from obfuscator import ctools, expressions
+from obfuscator.editbuffer import Edit, EditBuffer
+from obfuscator.sourceindex import NARROWING_MAX_DENSITY, SourceIndex
+
+
+class TechniqueCost(NamedTuple):
+    """Estimated runtime cost added to the generated code by a single
+    substitution of a technique.
+
+    Attributes:
+        instructions (int): extra arithmetic/logic operations.
+        calls (int): extra function calls (ex: `rand()`).
+    """
+
+    instructions: int = 0
+    calls: int = 0
 
 
 class Technique(Protocol):
-    """Technique Protocol. A single class method `apply` that applied the
-    technique to the source code and returns transformed code.
+    """Technique Protocol. A class method `apply` that applied the
+    technique to the source code and returns transformed code, and a class
+    method `edit` that records the same transformation as edits into an
+    `EditBuffer`, so that techniques can be chained without rebuilding the
+    source code after each of them. `edit` can be restricted to the region
+    `[start:end]` of the buffer.
+
+    Attributes:
+        COST (TechniqueCost): runtime cost of a single substitution.
+        STRENGTH (int): how much the technique obfuscates the code, relative
+        to the other techniques.
+        CHUNK_SAFE (bool): whether applying the technique separately to each
+        top-level function (see `obfuscator.parallel`) gives the same result as
+        applying it to the whole source code.
+        LIBS (Tuple[str, ...]): libs whose include statement may be inserted
+        by the technique.
+        TRIGGERS (Optional[str]): characters one of which every substitution
+        holds, within a single statement (see `SourceIndex.regions`). The
+        technique only searches the statements holding them. None to always
+        search the whole source code.
     """
 
+    COST = TechniqueCost()
+    STRENGTH = 0
+    CHUNK_SAFE = False
+    LIBS: Tuple[str, ...] = ()
+    TRIGGERS: Optional[str] = None
+
     @classmethod
     @abstractmethod
     def apply(cls, source_code: str) -> str:
         pass
 
+    @classmethod
+    @abstractmethod
+    def edit(cls, buffer: EditBuffer, start: int = 0, end: Optional[int] = None) -> int:
+        pass
+
 
 class PassthroughTechnique:
     """Passthrough technique, mostly for testing."""
 
+    COST = TechniqueCost()
+    STRENGTH = 0
+    CHUNK_SAFE = True
+
     @classmethod
     def apply(cls, source_code: str) -> str:
         return source_code
 
+    @classmethod
+    def edit(cls, buffer: EditBuffer, start: int = 0, end: Optional[int] = None) -> int:
+        return 0
+
 
 class ReplacingTechnique(Technique):
     """Base class when the technique is a simple regex
@@ -64,9 +118,86 @@ class ReplacingTechnique(Technique):
         Returns:
             str: transformed source code
         """
+        buffer = EditBuffer(source_code)
+        cls.edit(buffer)
+        return buffer.text()
+
+    @classmethod
+    def matches(
+        cls,
+        source_code: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        index: Optional[SourceIndex] = None,
+    ) -> Iterator[re.Match]:
+        """Iterate over the PATTERN matches in `source_code[start:end]`.
+
+        Args:
+            source_code (str): source code
+            start (int, optional): start of the region. Defaults to 0.
+            end (Optional[int], optional): end of the region. Defaults to None
+            (end of the source code).
+            index (Optional[SourceIndex], optional): index of the source code,
+            to only search the statements holding TRIGGERS. Defaults to None.
+
+        Returns:
+            Iterator[re.Match]: matches
+        """
         compiled_pattern = re.compile(cls.PATTERN)
-        obfuscated = compiled_pattern.sub(cls.REPLACEMENT, source_code)
-        return obfuscated
+        if end is None:
+            end = len(source_code)
+        if index is None or cls.TRIGGERS is None:
+            return compiled_pattern.finditer(source_code, start, end)
+        regions = index.regions(cls.TRIGGERS, start, end, NARROWING_MAX_DENSITY)
+        return itertools.chain.from_iterable(
+            compiled_pattern.finditer(source_code, region_start, region_end)
+            for region_start, region_end in regions
+        )
+
+    @classmethod
+    def edit(cls, buffer: EditBuffer, start: int = 0, end: Optional[int] = None) -> int:
+        """Record one edit per PATTERN match, replaced by the expanded
+        REPLACEMENT, into the buffer.
+
+        Args:
+            buffer (EditBuffer): source code buffer
+            start (int, optional): start of the region to edit. Defaults to 0.
+            end (Optional[int], optional): end of the region to edit.
+            Defaults to None (end of the buffer).
+
+        Returns:
+            int: number of substitutions
+        """
+        edits = [
+            Edit(match.start(), match.end(), cls.replace(match))
+            for match in cls.matches(buffer.text(), start, end, buffer.index())
+        ]
+        return buffer.apply(edits)
+
+    @classmethod
+    def replace(cls, match: re.Match) -> str:
+        """Replacement of a single match: the expanded REPLACEMENT.
+
+        Args:
+            match (re.Match): PATTERN match
+
+        Returns:
+            str: replacement text
+        """
+        return match.expand(cls.REPLACEMENT)
+
+    @classmethod
+    def substitutions(cls, match: re.Match) -> int:
+        """Number of substitutions (as accounted in COST) made when replacing
+        a single match.
+
+        Args:
+            match (re.Match): PATTERN match
+
+        Returns:
+            int: number of substitutions
+        """
+        return 1
 
 
 class RemoveSpacesTechnique(ReplacingTechnique):
@@ -74,6 +205,8 @@ class RemoveSpacesTechnique(ReplacingTechnique):
 
     PATTERN = r"\s*([\n=\+\-\*\^,\){};]|(?<!\*)\/(?!\*))\s*"
     REPLACEMENT = r"\1"
+    STRENGTH = 1
+    CHUNK_SAFE = True
 
 
 class ReplaceAdditionTechnique(ReplacingTechnique):
@@ -81,6 +214,69 @@ class ReplaceAdditionTechnique(ReplacingTechnique):
 
     PATTERN = r"(\w+)\s*(\+)\s*(\w+)(\s*)"
     REPLACEMENT = r"(-(-\1 + (-\3)))\4"
+    COST = TechniqueCost(instructions=3)
+    STRENGTH = 2
+    CHUNK_SAFE = True
+    TRIGGERS = "+"
+
+
+class ReplaceAdditionChainTechnique(ReplacingTechnique):
+    """Replace whole addition chains (ex: 'a+b+c+d') by a balanced tree of
+    additions (see `obfuscator.expressions`). Nesting and size expansion of
+    each chain are bounded by MAX_DEPTH and MAX_EXPANSION."""
+
+    PATTERN = expressions.CHAIN_PATTERN.pattern
+    REPLACEMENT = None  # Built for each chain
+    MAX_DEPTH = 4
+    MAX_EXPANSION = 3.0
+    COST = TechniqueCost(instructions=3)
+    STRENGTH = 2
+    CHUNK_SAFE = True
+    TRIGGERS = "+"
+
+    @classmethod
+    def matches(
+        cls,
+        source_code: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        index: Optional[SourceIndex] = None,
+    ) -> Iterator[re.Match]:
+        if end is None:
+            end = len(source_code)
+        if index is None:
+            return expressions.chain_matches(source_code, start, end)
+        regions = index.regions(cls.TRIGGERS, start, end, NARROWING_MAX_DENSITY)
+        return itertools.chain.from_iterable(
+            expressions.chain_matches(source_code, region_start, region_end)
+            for region_start, region_end in regions
+        )
+
+    @classmethod
+    def rewrite(cls, match: re.Match) -> Tuple[str, expressions.RewriteStats]:
+        """Rewrite a chain within the technique limits.
+
+        Args:
+            match (re.Match): chain match
+
+        Returns:
+            Tuple[str, expressions.RewriteStats]: rewritten chain and its
+            statistics.
+        """
+        chain = expressions.AdditionChain(
+            match.start(),
+            match.end(),
+            expressions.TERM_PATTERN.findall(match.group()),
+        )
+        return expressions.rewrite_chain(chain, cls.MAX_DEPTH, cls.MAX_EXPANSION)
+
+    @classmethod
+    def replace(cls, match: re.Match) -> str:
+        return cls.rewrite(match)[0]
+
+    @classmethod
+    def substitutions(cls, match: re.Match) -> int:
+        return cls.rewrite(match)[1].nodes
 
 
 class ReplaceXORTechnique(ReplacingTechnique):
@@ -89,6 +285,10 @@ class ReplaceXORTechnique(ReplacingTechnique):
 
     PATTERN = r"(\w+)\s*=\s*(\w+)\s*(?:\^)\s*(\w+)\s*;"
     REPLACEMENT = r"\1 = (~\2 & \3) | (\2 & ~\3);"
+    COST = TechniqueCost(instructions=4)
+    STRENGTH = 2
+    CHUNK_SAFE = True
+    TRIGGERS = "^"
 
 
 class ReplaceSingleAdditionTechnique(ReplacingTechnique):
@@ -97,17 +297,113 @@ class ReplaceSingleAdditionTechnique(ReplacingTechnique):
 
     PATTERN = r"(\w+)\s*=\s*(\w+)\s*(?:\+)\s*(\w+)\s*;"
     REPLACEMENT = r"r = rand (); \1 = \2 + r; \1 = \1 + \3; \1 = \1 - r;"
+    COST = TechniqueCost(instructions=3, calls=1)
+    STRENGTH = 3
+    CHUNK_SAFE = True
+    LIBS = ("stdlib.h",)
+    TRIGGERS = "+"
 
     @classmethod
-    def apply(cls, source_code: str) -> str:
-        """Overrides the default to include the 'stdlib.h' in includes
-        if not already present.
+    def edit(cls, buffer: EditBuffer, start: int = 0, end: Optional[int] = None) -> int:
+        """Overrides the default to include the LIBS ('stdlib.h') in includes
+        if not already present, when something was substituted.
 
         Args:
-            source_code (str): source code
+            buffer (EditBuffer): source code buffer
+            start (int, optional): start of the region to edit. Defaults to 0.
+            end (Optional[int], optional): end of the region to edit.
+            Defaults to None (end of the buffer).
 
         Returns:
-            str: transformed source code
+            int: number of substitutions
+        """
+        substitutions = super().edit(buffer, start, end)
+        if substitutions:
+            for lib in cls.LIBS:
+                buffer.insert_lib(lib)
+        return substitutions
+
+
+class ReplaceSingleAdditionConstantTechnique(ReplacingTechnique):
+    """Replace addition using a random constant chosen at obfuscation time
+    (see `EditBuffer.random`) instead of calling `rand()` at runtime.
+    Only works for single operation (ex: 'a = b + c;').
+
+    The generated code has no call, needs neither an extra variable nor a lib,
+    and the constant folds away when compiled with optimizations. Constants
+    are written with a fixed width, so that the code size does not depend on
+    the seed. Repeated identical statements get different constants.
+
+    Attributes:
+        REPLACEMENT_SWAPPED (str): replacement when the target is the right
+        operand (ex: 'a = b + a;'), which must be read before being assigned.
+        REPLACEMENT_DOUBLED (str): replacement when the target is both operands
+        (ex: 'a = a + a;'), where the constant is added twice.
+        CONSTANT_RANGE (Tuple[int, int]): bounds (included) of the constants,
+        small enough not to overflow an `int` added to small values.
+    """
+
+    PATTERN = ReplaceSingleAdditionTechnique.PATTERN
+    REPLACEMENT = r"\1 = \2 + {constant}; \1 = \1 + \3; \1 = \1 - {constant};"
+    REPLACEMENT_SWAPPED = r"\1 = \3 + {constant}; \1 = \1 + \2; \1 = \1 - {constant};"
+    REPLACEMENT_DOUBLED = r"\1 = \1 - {constant}; \1 = \1 + \1; \1 = \1 + {double};"
+    CONSTANT_RANGE = (0x1000, 0x7FFF)
+    COST = TechniqueCost(instructions=3)
+    STRENGTH = 2
+    CHUNK_SAFE = True
+    TRIGGERS = "+"
+
+    @classmethod
+    def edit(cls, buffer: EditBuffer, start: int = 0, end: Optional[int] = None) -> int:
+        """Overrides the default to draw the constant of each match from the
+        buffer, keyed by the enclosing function name, the matched statement and
+        its occurrence in the function, so that the constants do not depend on
+        the position of the function or on the chunking of the source code.
+
+        Args:
+            buffer (EditBuffer): source code buffer
+            start (int, optional): start of the region to edit. Defaults to 0.
+            end (Optional[int], optional): end of the region to edit.
+            Defaults to None (end of the buffer).
+
+        Returns:
+            int: number of substitutions
+        """
+        text = buffer.text()
+        functions = ctools.scan_function_signatures(text)
+        starts = [function.start for function in functions]
+        occurrences: Dict[Tuple[str, str], int] = {}
+        edits = []
+        for match in cls.matches(text, start, end, buffer.index()):
+            position = bisect.bisect_right(starts, match.start())
+            key = (functions[position - 1].name if position else "", match.group())
+            occurrences[key] = occurrences.get(key, -1) + 1
+            constant = buffer.random(cls.__name__, *key, occurrences[key]).randint(
+                *cls.CONSTANT_RANGE
+            )
+            edits.append(Edit(match.start(), match.end(), cls.replace(match, constant)))
+        return buffer.apply(edits)
+
+    @classmethod
+    def replace(cls, match: re.Match, constant: Optional[int] = None) -> str:
+        """Replacement of a single match.
+
+        Args:
+            match (re.Match): PATTERN match
+            constant (Optional[int], optional): added and subtracted constant.
+            Defaults to None (lower bound of CONSTANT_RANGE).
+
+        Returns:
+            str: replacement text
         """
-        obfuscated = super().apply(source_code)
-        return ctools.insert_lib(obfuscated, "stdlib.h")
+        if constant is None:
+            constant = cls.CONSTANT_RANGE[0]
+        target, left, right = match.groups()
+        replacement = cls.REPLACEMENT
+        if target == right:
+            replacement = cls.REPLACEMENT_SWAPPED
+            if target == left:
+                replacement = cls.REPLACEMENT_DOUBLED
+        return match.expand(replacement).format(
+            constant=f"{constant:#06x}", double=f"{2 * constant:#06x}"
+        )
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from obfuscator import ReplacementObfuscator
+from obfuscator.batch import (
+    RecordError,
+    RecordFormat,
+    obfuscate_stream,
+    read_records,
+    write_record,
+)
+
+SOURCES = [b"res = a + b;", b"", b"x = y ^ z;\n", "c = '\xe9';".encode("latin-1")]
+
+
+class TrickleStream(io.BytesIO):
+    """Stream returning a single byte per read, as a slow pipe."""
+
+    def read1(self, size=-1):
+        return super().read1(1)
+
+
+def encode(records, record_format):
+    stream = io.BytesIO()
+    for record in records:
+        write_record(stream, record, record_format)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize("record_format", list(RecordFormat))
+def test_records_round_trip(record_format):
+    data = encode(SOURCES, record_format)
+    assert SOURCES == list(read_records(io.BytesIO(data), record_format))
+    assert SOURCES == list(read_records(TrickleStream(data), record_format))
+
+
+def test_read_records_without_last_terminator():
+    stream = io.BytesIO(b"a;\0b;")
+    assert [b"a;", b"b;"] == list(read_records(stream, RecordFormat.NUL))
+
+
+@pytest.mark.parametrize("data", [b"12\nres = a", b"twelve\nres = a + b;"])
+def test_read_records_invalid_length(data):
+    with pytest.raises(RecordError):
+        list(read_records(io.BytesIO(data), RecordFormat.LENGTH))
+
+
+def fail(source_code):
+    raise ValueError(f"Cannot obfuscate ({source_code})")
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_obfuscate_stream_errors(workers):
+    data = encode([b"a;", b"b;"], RecordFormat.LENGTH)
+    with pytest.raises(ValueError) as error:
+        obfuscate_stream(
+            fail, io.BytesIO(data), io.BytesIO(), RecordFormat.LENGTH, workers
+        )
+    assert not isinstance(error.value, RecordError)
+    with pytest.raises(RecordError):
+        obfuscate_stream(
+            str, io.BytesIO(data + b"3\na"), io.BytesIO(), RecordFormat.LENGTH, workers
+        )
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+@pytest.mark.parametrize("record_format", list(RecordFormat))
+def test_obfuscate_stream(record_format, workers):
+    obfuscator = ReplacementObfuscator()
+    output = io.BytesIO()
+    count = obfuscate_stream(
+        obfuscator.obfuscate,
+        io.BytesIO(encode(SOURCES * 5, record_format)),
+        output,
+        record_format,
+        workers,
+    )
+    assert len(SOURCES) * 5 == count
+    expected = [
+        obfuscator.obfuscate(source.decode("utf-8", "surrogateescape")).encode(
+            "utf-8", "surrogateescape"
+        )
+        for source in SOURCES * 5
+    ]
+    output.seek(0)
+    assert expected == list(read_records(output, record_format))
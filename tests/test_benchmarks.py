@@ -0,0 +1,30 @@
+from typing import Dict
+
+from obfuscator import benchmarks
+
+
+def test_signature_extraction_adversarial_inputs():
+    def best_durations(size: int) -> Dict[str, float]:
+        runs = [benchmarks.benchmark_signature_extraction(size) for _ in range(5)]
+        return {name: min(run[name].duration for run in runs) for name in runs[0]}
+
+    results = benchmarks.benchmark_signature_extraction(20000)
+    assert {
+        "long_identifier_line": 0,
+        "unbalanced_parenthesis": 0,
+        "nested_parentheses": 1,
+        "pointer_run": 0,
+        "many_functions": 20000,
+        "multiline_parameters": 1,
+    } == {name: result.count for name, result in results.items()}
+    # Linear: x4, quadratic: x16
+    small, large = best_durations(5000), best_durations(20000)
+    for name, duration in large.items():
+        assert duration < 12 * small[name], name
+
+
+def test_single_addition_constant_avoids_rand_overhead(tmp_path):
+    results = benchmarks.benchmark_single_addition(tmp_path, iterations=1000, repeat=1)
+    assert {"original": 0, "rand": 1, "constant": 0} == {
+        name: result.count for name, result in results.items()
+    }
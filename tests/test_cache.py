@@ -0,0 +1,94 @@
+import pathlib
+
+from obfuscator import ReplacementObfuscator, cache, planner
+from obfuscator.techniques import ReplaceAdditionTechnique, ReplaceXORTechnique
+
+SOURCE = "res = a + b;"
+
+
+class PatchedAdditionTechnique(ReplaceAdditionTechnique):
+    PATTERN = r"(\w+)\s*(\+)\s*(\w+)"
+
+
+def test_fingerprint():
+    assert cache.fingerprint([ReplaceAdditionTechnique]) == cache.fingerprint(
+        [ReplaceAdditionTechnique]
+    )
+    assert cache.fingerprint([ReplaceAdditionTechnique]) != cache.fingerprint(
+        [PatchedAdditionTechnique]
+    )
+    assert cache.fingerprint(
+        [ReplaceAdditionTechnique, ReplaceXORTechnique]
+    ) != cache.fingerprint([ReplaceXORTechnique, ReplaceAdditionTechnique])
+    assert cache.fingerprint([ReplaceAdditionTechnique], 1.2) != cache.fingerprint(
+        [ReplaceAdditionTechnique], 1.5
+    )
+
+
+def test_memory_cache():
+    results = cache.ObfuscationCache(maxsize=1)
+    obfuscator = ReplacementObfuscator(cache=results)
+    obfuscated = obfuscator.obfuscate(SOURCE)
+    assert obfuscated == obfuscator.obfuscate(SOURCE)
+    assert (1, 1) == (results.hits, results.misses)
+    obfuscator.obfuscate("res = a ^ b;")
+    obfuscator.obfuscate(SOURCE)
+    assert (1, 3) == (results.hits, results.misses)
+
+
+def test_cache_key_depends_on_obfuscation():
+    results = cache.ObfuscationCache()
+    ReplacementObfuscator(cache=results).obfuscate(SOURCE)
+    source = "int f(int a, int b)\n{\n    return a + b;\n}\n"
+    for max_slowdown in (1.0, 10.0):
+        budget_planner = planner.Planner(max_slowdown=max_slowdown)
+        planner.PlannedObfuscator(budget_planner, results).obfuscate(source)
+    assert 0 == results.hits
+
+
+def test_disk_cache(tmp_path: pathlib.Path):
+    directory = tmp_path / "cache"
+    obfuscated = ReplacementObfuscator(
+        cache=cache.ObfuscationCache(directory=directory)
+    ).obfuscate(SOURCE)
+    results = cache.ObfuscationCache(directory=directory)
+    assert obfuscated == ReplacementObfuscator(cache=results).obfuscate(SOURCE)
+    assert (1, 1, 0) == (results.hits, results.disk_hits, results.misses)
+
+
+def test_disk_cache_size_cap(tmp_path: pathlib.Path):
+    results = cache.ObfuscationCache(directory=tmp_path, max_bytes=100)
+    for index in range(10):
+        results.put(f"{index:02d}key", "x" * 30)
+    assert sum(path.stat().st_size for path in tmp_path.glob("*/*")) <= 100
+
+
+def test_disk_eviction_skips_files_being_written(tmp_path: pathlib.Path):
+    results = cache.ObfuscationCache(directory=tmp_path, max_bytes=10)
+    (tmp_path / "00").mkdir()
+    in_flight = tmp_path / "00" / f"{cache.TEMP_PREFIX}writer"
+    in_flight.write_text("x" * 30)
+    results.put("00key", "x" * 30)
+    assert in_flight.exists()
+    assert not (tmp_path / "00" / "00key").exists()
+
+
+def test_disk_eviction_interval(tmp_path: pathlib.Path, monkeypatch):
+    results = cache.ObfuscationCache(directory=tmp_path, max_bytes=1000)
+    measures = []
+    evict_disk = results._evict_disk  # pylint: disable=protected-access
+    monkeypatch.setattr(results, "_evict_disk", lambda: measures.append(evict_disk()))
+    for index in range(cache.EVICT_INTERVAL):
+        results.put(f"{index:02d}key", "x")
+    # Measured on the first write and after EVICT_INTERVAL writes only
+    assert 2 == len(measures)
+    for index in range(100):
+        results.put(f"{index:02d}big", "x" * 30)
+    assert sum(path.stat().st_size for path in tmp_path.glob("*/*")) <= 1000
+
+
+def test_cache_key_depends_on_seed():
+    results = cache.ObfuscationCache()
+    for seed in (0, 1):
+        ReplacementObfuscator(cache=results, seed=seed).obfuscate(SOURCE)
+    assert (0, 2) == (results.hits, results.misses)
@@ -1,8 +1,9 @@
 import filecmp
 
 import click
+import pytest
 
-from obfuscator import cli, examples
+from obfuscator import ReplacementObfuscator, cli, examples
 
 
 def test_cli_obfuscate_passthrough(cli_runner, tmp_path, c_file):
@@ -76,3 +77,228 @@ def test_parser(cli_runner):
     )
     assert result.exit_code == 0
     assert "pi_approx" in result.stdout
+
+
+def test_obfuscate_with_budget(cli_runner):
+    sum42_path = examples.available_examples()["sum42.c"]["path"]
+    result = cli_runner.invoke(
+        cli.app,
+        ["obfuscate", str(sum42_path), "--max-slowdown", "2", "1", "2", "3"],
+    )
+    assert result.exit_code == 0
+    assert ">> f: [ReplaceAdditionTechnique" in result.stdout
+    assert result.stdout.count(">> Results: 137") == 2
+
+
+def test_obfuscate_constant_level(cli_runner):
+    sum42_path = examples.available_examples()["sum42.c"]["path"]
+    result = cli_runner.invoke(
+        cli.app, ["obfuscate", str(sum42_path), "-l", "8", "1", "2", "3"]
+    )
+    assert result.exit_code == 0
+    assert "uses (ConstantReplacementObfuscator)" in result.stdout
+    assert "rand" not in result.stdout and "stdlib.h" not in result.stdout
+    assert "c = c - 0x" in result.stdout
+    assert result.stdout.count(">> Results: 137") == 2
+
+
+def test_obfuscate_cache_dir(cli_runner, tmp_path, c_file):
+    command = ["obfuscate", str(c_file), "-l", "10", "--cache-dir", str(tmp_path)]
+    result = cli_runner.invoke(cli.app, command)
+    assert result.exit_code == 0
+    assert ">> Cache: 0 hit(s) (0 from disk), 1 miss(es)" in result.stdout
+    cached = cli_runner.invoke(cli.app, command)
+    assert ">> Cache: 1 hit(s) (1 from disk), 0 miss(es)" in cached.stdout
+    assert result.stdout.split(">> Cache")[0] == cached.stdout.split(">> Cache")[0]
+
+
+def test_cc(cli_runner, tmp_path, c_file):
+    object_file = tmp_path / "wrapped.o"
+    result = cli_runner.invoke(
+        cli.app,
+        ["cc", "-l", "10", "--", "gcc", "-c", str(c_file), "-o", str(object_file)]
+        + ["-MD", "-O2"],
+    )
+    assert result.exit_code == 0
+    assert object_file.exists()
+    dependencies = (tmp_path / "wrapped.d").read_text()
+    assert dependencies.startswith(f"{object_file}: {c_file} ")
+    assert ".h" in dependencies
+
+
+def test_cc_missing_input(cli_runner, tmp_path):
+    missing = tmp_path / "missing.c"
+    result = cli_runner.invoke(cli.app, ["cc", "--", "gcc", "-c", str(missing)])
+    assert result.exit_code == 1
+    assert f"Cannot read C input ({missing})" in result.stderr
+
+
+def test_cc_default_output(cli_runner, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sum42_path = examples.available_examples()["sum42.c"]["path"]
+    result = cli_runner.invoke(cli.app, ["cc", "--", "gcc", "-c", str(sum42_path)])
+    assert result.exit_code == 0
+    assert (tmp_path / "sum42.o").exists()
+
+
+def test_cc_returns_gcc_errors(cli_runner, tmp_path):
+    broken = tmp_path / "broken.c"
+    broken.write_text("int f(void) { return }")
+    result = cli_runner.invoke(cli.app, ["cc", "--", "gcc", "-c", str(broken)])
+    assert result.exit_code != 0
+
+
+def test_cc_several_inputs_to_single_output(cli_runner, tmp_path, c_file):
+    result = cli_runner.invoke(
+        cli.app,
+        ["cc", "--", "gcc", "-c", str(c_file), str(c_file), f"-o{tmp_path / 'o.o'}"],
+    )
+    assert result.exit_code == 1
+    assert "Several C inputs" in result.stderr
+    assert "" == result.stdout
+
+
+def test_obfuscate_workers(cli_runner, tmp_path, c_file):
+    outputs = []
+    for workers in ("1", "2"):
+        output_file = tmp_path / f"obfuscated_{workers}.c"
+        result = cli_runner.invoke(
+            cli.app,
+            ["obfuscate", str(c_file), "-l", "10", "--output-file", str(output_file)]
+            + ["--workers", workers],
+        )
+        assert result.exit_code == 0
+        outputs.append(output_file.read_text())
+    assert outputs[0] == outputs[1]
+
+
+def test_obfuscate_check_determinism(cli_runner, tmp_path, c_file):
+    result = cli_runner.invoke(
+        cli.app,
+        ["obfuscate", str(c_file), "-l", "10", "--output-file", str(tmp_path / "o.c")]
+        + ["--seed", "7", "--check-determinism"],
+    )
+    assert result.exit_code == 0
+    assert "fresh interpreter: sha256" in result.stdout
+    assert ">> Determinism check passed" in result.stdout
+
+
+def test_obfuscate_check_determinism_with_budget(cli_runner, c_file):
+    result = cli_runner.invoke(
+        cli.app,
+        ["obfuscate", str(c_file), "-l", "10", "--check-determinism"]
+        + ["--time-budget", "30"],
+    )
+    assert result.exit_code == 1
+    assert "not supported with budgets" in result.stderr
+    assert "Determinism check" not in result.stdout
+
+
+def test_obfuscate_time_budget(cli_runner, tmp_path, c_file):
+    output_file = tmp_path / "obfuscated.c"
+    log_path = tmp_path / "degradations.jsonl"
+    result = cli_runner.invoke(
+        cli.app,
+        ["obfuscate", str(c_file), "-l", "10", "--output-file", str(output_file)]
+        + ["--time-budget", "30", "--memory-budget", "512"]
+        + ["--degradation-log", str(log_path)],
+    )
+    assert result.exit_code == 0
+    assert "fell back" not in result.stdout
+    assert not log_path.exists()
+    assert ReplacementObfuscator().obfuscate(c_file.read_text()) == (
+        output_file.read_text()
+    )
+
+
+def test_obfuscate_workers_with_budgets(cli_runner, tmp_path):
+    # Large enough to be split across the workers
+    big_file = tmp_path / "big.c"
+    big_file.write_text(
+        "".join(
+            f"int f{index}(int a, int b)\n{{\n    int c;\n    c = a + b;\n"
+            f"    return c ^ {index};\n}}\n"
+            for index in range(1000)
+        )
+    )
+    outputs = []
+    for budgets in ([], ["--time-budget", "60", "--memory-budget", "1024"]):
+        output_file = tmp_path / f"obfuscated_{len(budgets)}.c"
+        result = cli_runner.invoke(
+            cli.app,
+            ["obfuscate", str(big_file), "-l", "10", "--workers", "2"]
+            + ["--output-file", str(output_file)]
+            + budgets,
+        )
+        assert result.exit_code == 0, result.stdout
+        assert "fell back" not in result.stdout
+        outputs.append(output_file.read_text())
+    assert outputs[0] == outputs[1]
+
+
+KERNEL = r"""#include <stdint.h>
+#include <stddef.h>
+
+uint32_t checksum(uint8_t *buf, size_t n)
+{
+    uint32_t sum, value;
+    sum = 0;
+    for (size_t i = 0; i < n; i++) {
+        value = buf[i];
+        sum = sum + value;
+        buf[i] = value ^ 1;
+    }
+    return sum;
+}
+"""
+
+
+def test_obfuscate_buffer_argument(cli_runner, tmp_path):
+    c_file = tmp_path / "kernel.c"
+    c_file.write_text(KERNEL)
+    input_file = tmp_path / "input.bin"
+    input_file.write_bytes(bytes(range(100)))
+    result = cli_runner.invoke(
+        cli.app,
+        ["obfuscate", str(c_file), f"@{input_file}", "100", "-l", "10"],
+    )
+    assert result.exit_code == 0
+    assert 2 == result.stdout.count(f">> Results: {sum(range(100))} ")
+    digests = [line for line in result.stdout.splitlines() if "sha256" in line]
+    assert 2 == len(digests) and digests[0] == digests[1]
+    assert bytes(range(100)) == input_file.read_bytes()
+
+
+def test_obfuscate_invalid_argument(cli_runner, tmp_path, c_file):
+    result = cli_runner.invoke(
+        cli.app, ["obfuscate", str(c_file), f"@{tmp_path / 'missing.bin'}"]
+    )
+    assert result.exit_code != 0
+
+
+def test_obfuscate_batch(cli_runner, c_file):
+    source = c_file.read_text()
+    records = source.encode() + b"\0" + b"res = a ^ b;" + b"\0"
+    result = cli_runner.invoke(
+        cli.app,
+        ["obfuscate", "--batch", "nul", "-l", "10", "--workers", "2", "-"],
+        input=records,
+    )
+    assert result.exit_code == 0
+    expected = [
+        ReplacementObfuscator().obfuscate(source),
+        "res = (~a & b) | (a & ~b);",
+    ]
+    assert "\0".join(expected) + "\0" == result.stdout_bytes.decode()
+
+
+@pytest.mark.parametrize("workers", [[], ["--workers", "2"]])
+def test_obfuscate_batch_truncated_record(cli_runner, workers):
+    result = cli_runner.invoke(
+        cli.app,
+        ["obfuscate", "--batch", "length", "-"] + workers,
+        input=b"12\nres = a",
+    )
+    assert result.exit_code == 1
+    assert "Invalid record stream: Truncated record" in result.stderr
+    assert b"" == result.stdout_bytes
@@ -1,6 +1,14 @@
+import array
+import mmap
 import pathlib
 
-from obfuscator import ctools
+import pytest
+
+from obfuscator import ctools, pool
+from obfuscator.techniques import (
+    ReplaceSingleAdditionConstantTechnique,
+    ReplaceSingleAdditionTechnique,
+)
 
 BASIC_FUNCTION = r"""uint8_t f(uint32_t a, uint32_t b, uint32_t c)
 {
@@ -60,6 +68,19 @@ def test_get_function_name():
     assert False
 
 
+@pytest.mark.parametrize(
+    "signature",
+    [
+        "int f(int a)",
+        "uint32_t f(uint32_t a, uint32_t b)",
+        "static int f(void);",
+        "int f(a, b)\nint a;\nint b;\n{\n    return a + b;\n}",
+    ],
+)
+def test_get_function_name_signatures(signature):
+    assert "f" == ctools.get_function_name(signature)
+
+
 def test_count_args():
     assert 3 == ctools.count_args("uint8_t f(uint32_t a, uint32_t b, uint32_t c);")
 
@@ -73,3 +94,253 @@ def test_comile_raises(tmp_path: pathlib.Path):
         assert True
         return
     assert False
+
+
+MULTI_FUNCTIONS = r"""#include <stdint.h>
+
+static uint32_t twice(uint32_t a)
+{
+    return a + a;
+}
+
+uint32_t add(uint32_t a, uint32_t b)
+{
+    return a + b;
+}
+
+uint32_t add_twice(uint32_t a, uint32_t b)
+{
+    uint32_t sum = add(a, b);
+    return twice(sum);
+}
+"""
+
+
+def test_get_cdef():
+    assert ctools.get_cdef(MULTI_FUNCTIONS).splitlines() == [
+        "uint32_t twice(uint32_t a);",
+        "uint32_t add(uint32_t a, uint32_t b);",
+        "uint32_t add_twice(uint32_t a, uint32_t b);",
+    ]
+
+
+def test_compile_source(tmp_path: pathlib.Path):
+    runner = ctools.Runner(tmp_path)
+    names = runner.compile_source("multi", MULTI_FUNCTIONS)
+    assert ["twice", "add", "add_twice"] == names
+    assert 4 == runner.run("multi", "twice", 2)
+    assert 5 == runner.run("multi", "add", 2, 3)
+    assert 10 == runner.run("multi", "add_twice", 2, 3)
+
+
+def test_compile_and_run_function_name(tmp_path: pathlib.Path):
+    runner = ctools.Runner(tmp_path)
+    assert 10 == runner.compile_and_run(
+        "multi", MULTI_FUNCTIONS, 2, 3, function_name="add_twice"
+    )
+
+
+def test_compare_sources(tmp_path: pathlib.Path):
+    runner = ctools.Runner(tmp_path)
+    other = MULTI_FUNCTIONS.replace("return a + a;", "return a * 3;")
+    assert {"add": True, "twice": False} == runner.compare_sources(
+        MULTI_FUNCTIONS, other, {"add": (1, 2), "twice": (1,)}
+    )
+
+
+def test_scan_function_signatures():
+    source = (
+        MULTI_FUNCTIONS
+        + "\nint proto(int a);\nchar *\nname(int a,\n     int b)\n{\n}\n"
+    )
+    signatures = ctools.scan_function_signatures(source)
+    assert ["twice", "add", "add_twice", "name"] == [s.name for s in signatures]
+    name = signatures[-1]
+    assert "char *" == name.return_type
+    assert "int a, int b" == name.parameters
+    assert "char * name(int a, int b)" == name.text
+    assert source[name.start : name.body_end].startswith("char *\nname(")
+    assert source[name.start : name.body_end].endswith("{\n}")
+    declarations = ctools.scan_function_signatures(source, declarations=True)
+    assert "proto" in [s.name for s in declarations]
+
+
+def test_scan_function_signatures_ignores_calls_and_comments():
+    source = r"""# define CALL(x) \
+    f(x) {
+// int commented(int a) {}
+/* int block(int a) {} */
+int arr[] = {1, 2};
+int g(int a) { return twice(add(a, "(")); }
+"""
+    assert ["int g(int a);"] == ctools.get_function_signatures(source)
+
+
+def test_get_gcc_c_inputs():
+    command = ["gcc", "-c", "a.c", "-o", "b.c", "-I", "inc.c", "-DX=1", "c.c"]
+    assert [2, 8] == ctools.get_gcc_c_inputs(command)
+
+
+def test_gcc_wrap_passthrough(tmp_path: pathlib.Path):
+    assert 0 == ctools.gcc_wrap(["gcc", "--version"], str.upper)
+
+
+def test_gcc_wrap_several_inputs(tmp_path: pathlib.Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("a", "b"):
+        (tmp_path / f"{name}.c").write_text(f"int {name}(int x) {{ return x + 1; }}")
+    assert 0 == ctools.gcc_wrap(["gcc", "-c", "a.c", "b.c", "-MD"], lambda s: s)
+    assert (tmp_path / "a.o").exists() and (tmp_path / "b.o").exists()
+    assert (tmp_path / "b.d").read_text().startswith("b.o:")
+    with pytest.raises(ValueError):
+        ctools.gcc_wrap(["gcc", "a.c", "b.c"], lambda s: s)
+    with pytest.raises(ValueError):
+        ctools.gcc_wrap(["gcc", "-c", "a.c", "b.c", "-oab.o"], lambda s: s)
+
+
+def test_gcc_wrap_joined_output(tmp_path: pathlib.Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.c").write_text("int a(int x) { return x + 1; }")
+    assert 0 == ctools.gcc_wrap(["gcc", "-c", "a.c", "-oout.o", "-MD"], str)
+    assert (tmp_path / "out.o").exists() and not (tmp_path / "a.o").exists()
+    assert (tmp_path / "out.d").read_text().startswith("out.o: a.c")
+
+
+def test_gcc_wrap_dependencies(tmp_path: pathlib.Path, monkeypatch, capfd):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.c").write_text('#include "a.h"\nint a(void) { return A; }')
+    (tmp_path / "src" / "a.h").write_text("#define A 1\n")
+    # Shadowed by the header next to the source, as for quoted includes in gcc
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "a.h").write_text("#error wrong header\n")
+    command = ["gcc", "-iquote", "other", "-c", "src/a.c"]
+    assert 0 == ctools.gcc_wrap(command + ["-MMD", "-MF", "a.dep"], str)
+    assert "a.o: src/a.c src/a.h" == (tmp_path / "a.dep").read_text().strip()
+    assert 0 == ctools.gcc_wrap(command + ["-MM"], str)
+    assert "a.o: src/a.c src/a.h" == capfd.readouterr().out.strip()
+
+
+def test_add_dependency():
+    assert "a.o: dir/my\\ $$a.c b.h\n" == ctools.add_dependency(
+        "a.o: b.h\n", "dir/my $a.c"
+    )
+    assert "a.o: a.c\n" == ctools.add_dependency("a.o:\n", "a.c")
+    assert "" == ctools.add_dependency("", "a.c")
+
+
+def test_line_directive():
+    source = "#include <stdint.h>\nint f(void);\n"
+    obfuscated = "#include <stdlib.h>\n#include <stdint.h>\nint f(void);\n"
+    assert [
+        "#include <stdlib.h>",
+        r'#line 1 "dir\\a \"b\".c"',
+        "#include <stdint.h>",
+    ] == ctools.line_directive(source, obfuscated, r'dir\a "b".c').split("\n")[:3]
+
+
+def test_gcc_wrap_diagnostic_lines(tmp_path: pathlib.Path, capfd):
+    broken = tmp_path / "broken.c"
+    broken.write_text(
+        "int f(int a, int b) {\n  int c;\n  c = a + b;\n  return c +;\n}\n"
+    )
+    obfuscate = ReplaceSingleAdditionTechnique.apply
+    assert "stdlib.h" in obfuscate(broken.read_text())
+    assert 0 != ctools.gcc_wrap(
+        ["gcc", "-c", str(broken), "-o", "/dev/null"], obfuscate
+    )
+    assert f"{broken}:4:" in capfd.readouterr().err
+
+
+def test_single_addition_constant_semantics(tmp_path: pathlib.Path):
+    source = r"""#include <stdint.h>
+
+uint32_t f(uint32_t x, uint32_t y)
+{
+    x = y + x;
+    y = x + y;
+    x = x + x;
+    y = y + y;
+    return x ^ (y << 8);
+}
+"""
+    obfuscated = ReplaceSingleAdditionConstantTechnique.apply(source)
+    runner = ctools.Runner(tmp_path)
+    runner.compile_source("original", source)
+    runner.compile_source("obfuscated", obfuscated)
+    for args in [(3, 5), (0xFFFFFFFF, 7), (123456, 0)]:
+        assert runner.run("original", "f", *args) == runner.run(
+            "obfuscated", "f", *args
+        )
+
+
+BUFFER_FUNCTIONS = r"""#include <stdint.h>
+#include <stddef.h>
+
+uint32_t checksum(const uint8_t *buf, size_t n)
+{
+    uint32_t sum = 0;
+    for (size_t i = 0; i < n; i++) {
+        sum = sum * 31 + buf[i];
+    }
+    return sum;
+}
+
+void scale(int32_t *values, size_t n, int32_t factor)
+{
+    for (size_t i = 0; i < n; i++) {
+        values[i] = values[i] * factor;
+    }
+}
+
+void fill(void *out, size_t n)
+{
+    for (size_t i = 0; i < n; i++) {
+        ((uint8_t *)out)[i] = (uint8_t)i;
+    }
+}
+"""
+
+
+def test_run_buffer_arguments(tmp_path: pathlib.Path):
+    runner = ctools.Runner(tmp_path)
+    runner.compile_source("buffers", BUFFER_FUNCTIONS)
+    data = bytearray(b"\x01\x02\x03")
+    assert (1 * 31 + 2) * 31 + 3 == runner.run("buffers", "checksum", data, 3)
+    assert 3 == runner.run("buffers", "checksum", memoryview(data)[2:], 1)
+    assert 3 == runner.run("buffers", "checksum", b"\x03", 1)
+    values = array.array("i", [1, -2, 3])
+    runner.run("buffers", "scale", values, 3, 10)
+    assert [10, -20, 30] == values.tolist()
+    out = bytearray(4)
+    runner.run("buffers", "fill", out, 4)
+    assert bytearray(b"\x00\x01\x02\x03") == out
+    with pytest.raises(ValueError):
+        runner.run("buffers", "scale", values, data, 2)
+
+
+def test_run_read_only_buffers(tmp_path: pathlib.Path):
+    runner = ctools.Runner(tmp_path)
+    runner.compile_source("buffers", BUFFER_FUNCTIONS)
+    # Written by the function, but bytes are immutable
+    data = bytes(8)
+    runner.run("buffers", "fill", data, 8)
+    assert bytes(8) == data
+    assert b"\x00" * 8 == bytes(8)
+    values = array.array("i", [1, -2, 3])
+    runner.run("buffers", "scale", memoryview(values).toreadonly(), 3, 10)
+    assert [1, -2, 3] == values.tolist()
+
+
+def test_run_mmap_argument(tmp_path: pathlib.Path):
+    path = tmp_path / "input.bin"
+    path.write_bytes(bytes(1024))
+    with pool.ExecutionPool(workers=1) as execution_pool:
+        runner = ctools.Runner(tmp_path, pool=execution_pool)
+        runner.compile_source("mapped", BUFFER_FUNCTIONS)
+        with open(path, "rb") as binary_file:
+            mapped = mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        # Buffers are copied to the pool workers and the results copied back
+        runner.run("mapped", "fill", mapped, 1024)
+        assert bytes(range(256)) * 4 == mapped[:]
+        assert bytes(1024) == path.read_bytes()
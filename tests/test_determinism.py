@@ -0,0 +1,64 @@
+import os
+import subprocess
+
+import pytest
+
+from obfuscator import ReplacementObfuscator, cache, determinism, planner
+from obfuscator.determinism import check_determinism, output_digest
+
+FUNCTION = r"""
+int f{index}(int a, int b)
+{{
+    int c = a + b;
+    c = c ^ {index};
+    return c + {index};
+}}
+"""
+
+SOURCE = "#include <stdint.h>\n" + "".join(
+    FUNCTION.format(index=index) for index in range(8)
+)
+
+
+@pytest.mark.parametrize(
+    "obfuscator",
+    [
+        ReplacementObfuscator(seed=3),
+        planner.PlannedObfuscator(planner.Planner(max_slowdown=10.0), seed=3),
+    ],
+)
+def test_check_determinism(obfuscator):
+    digests = check_determinism(obfuscator, SOURCE)
+    assert {
+        "sequential #1",
+        "sequential #2",
+        "parallel x2",
+        "fresh interpreter",
+    } == set(digests)
+    assert {output_digest(obfuscator.obfuscate(SOURCE))} == set(digests.values())
+
+
+def test_check_determinism_skips_cache():
+    results = cache.ObfuscationCache()
+    check_determinism(ReplacementObfuscator(cache=results), SOURCE)
+    assert (0, 0) == (results.hits, results.misses)
+
+
+@pytest.mark.parametrize("pythonpath", [None, "", os.pathsep.join(["", "extra", ""])])
+def test_subprocess_pythonpath(monkeypatch, pythonpath):
+    if pythonpath is None:
+        monkeypatch.delenv("PYTHONPATH", raising=False)
+    else:
+        monkeypatch.setenv("PYTHONPATH", pythonpath)
+    envs = []
+
+    def run(command, **kwargs):
+        envs.append(kwargs["env"])
+        return subprocess.CompletedProcess(command, 0, stdout=b"res = a + b;")
+
+    monkeypatch.setattr(determinism.subprocess, "run", run)
+    obfuscated = determinism._obfuscate_in_subprocess(ReplacementObfuscator(), "")
+    assert "res = a + b;" == obfuscated
+    paths = envs[0]["PYTHONPATH"].split(os.pathsep)
+    assert determinism.PACKAGE_ROOT == paths[0]
+    assert (["extra"] if pythonpath else []) == paths[1:]
@@ -0,0 +1,64 @@
+from obfuscator.editbuffer import Edit, EditBuffer
+
+SOURCE = "int a = b + c;"
+
+
+def test_untouched_buffer_returns_source():
+    buffer = EditBuffer(SOURCE)
+    assert buffer.text() is SOURCE
+    assert len(buffer) == len(SOURCE)
+
+
+def test_apply_edits():
+    buffer = EditBuffer(SOURCE)
+    assert 2 == buffer.apply([Edit(12, 13, "d"), Edit(8, 9, "e")])
+    assert buffer.text() == "int a = e + d;"
+    buffer.insert(0, "/* x */ ")
+    buffer.insert(len(buffer), "\n")
+    assert buffer.text() == "/* x */ int a = e + d;\n"
+    assert buffer.edit_count == 4
+
+
+def test_apply_edit_across_pieces():
+    buffer = EditBuffer(SOURCE)
+    buffer.apply([Edit(4, 5, "x"), Edit(8, 9, "y")])
+    buffer.apply([Edit(2, 10, "")])
+    assert buffer.text() == "in+ c;"
+
+
+def test_overlapping_edits_raise():
+    buffer = EditBuffer(SOURCE)
+    try:
+        buffer.apply([Edit(0, 5, ""), Edit(4, 6, "")])
+    except ValueError:
+        assert True
+        return
+    assert False
+
+
+def test_insert_lib():
+    buffer = EditBuffer("#include <stdint.h>\n")
+    buffer.insert_lib("stdint.h")
+    buffer.insert_lib("stdlib.h")
+    buffer.insert_lib("stdlib.h")
+    assert buffer.text() == "#include <stdlib.h>\n#include <stdint.h>\n"
+
+
+def test_random_depends_on_seed_and_key():
+    first = EditBuffer(SOURCE, seed=1).random("technique", "a + b").random()
+    assert first == EditBuffer("", seed=1).random("technique", "a + b").random()
+    assert first != EditBuffer(SOURCE, seed=2).random("technique", "a + b").random()
+    assert first != EditBuffer(SOURCE, seed=1).random("technique", "a ^ b").random()
+
+
+def test_text_cached_and_compacted():
+    buffer = EditBuffer(SOURCE)
+    for round_ in range(3):
+        buffer.apply([Edit(0, 0, f"/* {round_} */")])
+        text = buffer.text()
+        assert text is buffer.text()
+        assert 0 == buffer.apply([])
+        assert text is buffer.text()
+        assert len(text) == len(buffer)
+    assert buffer.text() == "/* 2 *//* 1 *//* 0 */" + SOURCE
+    assert 1 == len(buffer._get_pieces())  # pylint: disable=protected-access
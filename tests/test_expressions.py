@@ -0,0 +1,48 @@
+import pathlib
+
+from obfuscator import ctools, expressions
+
+
+def test_find_addition_chains():
+    source = "x = y - a + b; z = a + b * c; w = 1e+5; s = a + b + 42; return p + q;"
+    chains = expressions.find_addition_chains(source)
+    assert [["a", "b", "42"], ["p", "q"]] == [chain.terms for chain in chains]
+
+
+def test_rewrite_chain():
+    source = "res = a + b + c + 42;"
+    rewritten, stats = expressions.rewrite_additions(source, max_expansion=10)
+    expected = "res = (-(-(-(-a + (-b))) + (-(-(-c + (-42))))));"
+    assert expected == rewritten
+    assert (1, 4, 3, 2) == stats[:4]
+    assert stats.growth > 1
+
+
+def test_rewrite_limits():
+    terms = [f"x{i}" for i in range(300)]
+    source = "s = " + " + ".join(terms) + ";"
+    _, unbounded = expressions.rewrite_additions(source, 100, 100.0)
+    assert 299 == unbounded.nodes
+    assert 9 == unbounded.max_depth
+
+    rewritten, stats = expressions.rewrite_additions(source, 3, 100.0)
+    assert 7 == stats.nodes
+    assert 3 == stats.max_depth
+
+    rewritten, stats = expressions.rewrite_additions(source, 100, 1.5)
+    assert stats.growth <= 1.5
+    assert len(rewritten) - len(source) == stats.output_length - stats.input_length
+
+
+def test_rewritten_chain_result(tmp_path: pathlib.Path):
+    terms = [f"a{i % 4}" for i in range(200)]
+    source = (
+        "int sum(int a0, int a1, int a2, int a3)\n{\n"
+        f"    return {' + '.join(terms)};\n}}\n"
+    )
+    rewritten, stats = expressions.rewrite_additions(source, 6, 3.0)
+    assert stats.nodes > 0
+    runner = ctools.Runner(tmp_path)
+    assert {"sum": True} == runner.compare_sources(
+        source, rewritten, {"sum": (1, -2, 3, 5)}
+    )
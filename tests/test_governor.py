@@ -0,0 +1,108 @@
+import json
+import multiprocessing
+import pathlib
+import time
+
+import pytest
+
+from obfuscator import HarderToRead, Obfuscator, ReplacementObfuscator, governor
+from obfuscator.cache import ObfuscationCache
+from obfuscator.techniques import PassthroughTechnique
+
+SOURCE = "int f(int a, int b)\n{\n    return a + b;\n}\n"
+
+
+class SlowTechnique(PassthroughTechnique):
+    @classmethod
+    def edit(cls, buffer, start=0, end=None):
+        time.sleep(5)
+        return 0
+
+
+def allocate(size: int) -> int:
+    data = bytearray(size)
+    time.sleep(5)
+    return len(data)
+
+
+def fail():
+    raise ValueError("Expected")
+
+
+def start_worker(pid_path: pathlib.Path) -> None:
+    worker = multiprocessing.get_context("fork").Process(target=time.sleep, args=(30,))
+    worker.start()
+    pid_path.write_text(str(worker.pid))
+    time.sleep(30)
+
+
+def is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as stat:
+            return stat.read().split(")")[-1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+def test_run_within_budget():
+    resource_governor = governor.ResourceGovernor(time_budget=5, memory_budget=2**30)
+    assert 3 == resource_governor.run(sum, [1, 2])
+    with pytest.raises(ValueError):
+        resource_governor.run(fail)
+
+
+def test_run_exceeds_time():
+    resource_governor = governor.ResourceGovernor(time_budget=0.2)
+    with pytest.raises(governor.BudgetExceededError) as error:
+        resource_governor.run(time.sleep, 5)
+    assert "time" == error.value.reason
+    assert error.value.elapsed < 5
+
+
+@pytest.mark.skipif(not pathlib.Path("/proc/self/stat").exists(), reason="Needs /proc")
+def test_run_kills_worker_processes(tmp_path: pathlib.Path):
+    pid_path = tmp_path / "worker.pid"
+    resource_governor = governor.ResourceGovernor(time_budget=1)
+    with pytest.raises(governor.BudgetExceededError):
+        resource_governor.run(start_worker, pid_path)
+    worker_pid = int(pid_path.read_text())
+    deadline = time.monotonic() + 5
+    while is_running(worker_pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not is_running(worker_pid)
+
+
+@pytest.mark.skipif(not pathlib.Path("/proc/self/statm").exists(), reason="Needs /proc")
+def test_run_exceeds_memory():
+    resource_governor = governor.ResourceGovernor(memory_budget=16 * 2**20)
+    with pytest.raises(governor.BudgetExceededError) as error:
+        resource_governor.run(allocate, 128 * 2**20)
+    assert "memory" == error.value.reason
+    assert error.value.memory > 16 * 2**20
+
+
+def test_obfuscate_falls_back(tmp_path: pathlib.Path):
+    log_path = tmp_path / "degradations.jsonl"
+    resource_governor = governor.ResourceGovernor(time_budget=0.5, log_path=log_path)
+    obfuscated = resource_governor.obfuscate(
+        Obfuscator([SlowTechnique]), SOURCE, "slow.c"
+    )
+    assert HarderToRead().obfuscate(SOURCE) == obfuscated
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert 1 == len(records)
+    assert "slow.c" == records[0]["file"]
+    assert "Obfuscator" == records[0]["requested"]
+    assert "HarderToRead" == records[0]["fallback"]
+    assert "time" == records[0]["reason"]
+    assert 0.5 == records[0]["time_budget"]
+
+
+def test_obfuscate_uses_cache():
+    cache = ObfuscationCache()
+    resource_governor = governor.ResourceGovernor(time_budget=5)
+    expected = ReplacementObfuscator().obfuscate(SOURCE)
+    for _ in range(2):
+        obfuscated = resource_governor.obfuscate(ReplacementObfuscator(cache), SOURCE)
+        assert expected == obfuscated
+    assert 1 == cache.hits
+    assert not resource_governor.degradations
@@ -2,6 +2,7 @@ import filecmp
 import pathlib
 
 from obfuscator import (
+    ConstantReplacementObfuscator,
     HarderToRead,
     PassthroughObfuscator,
     ReplacementObfuscator,
@@ -64,4 +65,22 @@ def test_replacementobfuscator_change_bytecode(
     ctools.gcc_compile(module="original", source=source_code, tmp_dir=tmp_path)
     ctools.gcc_compile(module="obfuscated", source=obfuscated, tmp_dir=tmp_path)
 
-    assert False == filecmp.cmp(tmp_path / "original.o", tmp_path / "obfuscated.o")
+    # Sources without a safe substitution (ex: pi.c, whose only addition is
+    # bound to multiplications) are left unchanged
+    changed = obfuscated != source_code
+    assert changed == (c_file.name != "pi.c")
+    assert changed != filecmp.cmp(tmp_path / "original.o", tmp_path / "obfuscated.o")
+
+
+def test_constantreplacementobfuscator_doesnt_call_rand(
+    c_file: pathlib.Path, tmp_path: pathlib.Path
+):
+    source_code = c_file.read_text()
+    obfuscated = ConstantReplacementObfuscator().obfuscate(source_code)
+    assert obfuscated.count("rand") == source_code.count("rand")
+    assert obfuscated == ConstantReplacementObfuscator().obfuscate(source_code)
+    header = ctools.get_function_signatures(source_code)[0]
+    args = list(range(1, 1 + ctools.count_args(header)))
+    runner = ctools.Runner(tmp_path)
+    if "rand" not in source_code:
+        assert runner.compare_functions(source_code, obfuscated, *args)
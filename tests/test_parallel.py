@@ -0,0 +1,82 @@
+import pytest
+
+from obfuscator import HarderToRead, Obfuscator, ReplacementObfuscator, planner
+from obfuscator.parallel import ParallelObfuscator, split_functions, split_source
+from obfuscator.techniques import (
+    RemoveSpacesTechnique,
+    ReplaceAdditionChainTechnique,
+    ReplaceAdditionTechnique,
+    ReplaceSingleAdditionTechnique,
+    ReplaceXORTechnique,
+)
+
+FUNCTION = r"""
+/* Function {index} */
+int f{index}(int a, int b)
+{{
+    int c, r;
+    c = a + b;
+    c = c ^ {index};
+    for (r = 0; r < b; r++) {{ c = c + r + a; }}
+    return c + {index};
+}}
+"""
+
+SOURCE = "\n\n#include <stdint.h>\nint global = 1 + 2;\n" + "".join(
+    FUNCTION.format(index=index) for index in range(40)
+)
+
+
+def test_split_functions():
+    offsets = split_functions(SOURCE)
+    assert 40 == len(offsets)
+    for offset in offsets:
+        assert SOURCE.startswith("int f", offset)
+
+
+def test_split_source():
+    chunks = split_source(SOURCE, 8)
+    assert SOURCE == "".join(chunks)
+    assert 1 < len(chunks) <= 8
+    assert [SOURCE] == split_source(SOURCE, 8, min_chunk_size=len(SOURCE))
+
+
+@pytest.mark.parametrize(
+    "obfuscator",
+    [
+        HarderToRead(),
+        ReplacementObfuscator(),
+        Obfuscator(
+            [
+                ReplaceSingleAdditionTechnique,
+                RemoveSpacesTechnique,
+                ReplaceAdditionTechnique,
+                ReplaceXORTechnique,
+            ]
+        ),
+        planner.PlannedObfuscator(planner.Planner(max_slowdown=2.0)),
+    ],
+)
+def test_parallel_same_as_sequential(obfuscator: Obfuscator):
+    with ParallelObfuscator(obfuscator, workers=4, min_chunk_size=0) as parallel:
+        obfuscated = parallel.obfuscate(SOURCE)
+    assert obfuscator.obfuscate(SOURCE) == obfuscated
+    assert parallel.fingerprint() == obfuscator.fingerprint()
+
+
+def test_parallel_includes_once():
+    obfuscator = ParallelObfuscator(
+        Obfuscator([ReplaceSingleAdditionTechnique]), workers=4, min_chunk_size=0
+    )
+    obfuscated = obfuscator.obfuscate(SOURCE)
+    obfuscator.close()
+    assert 1 == obfuscated.count("#include <stdlib.h>")
+    assert obfuscated.startswith("#include <stdlib.h>\n")
+
+
+def test_stages():
+    stages = ReplacementObfuscator().stages()
+    assert [[ReplaceAdditionChainTechnique, ReplaceSingleAdditionTechnique]] + [
+        [ReplaceXORTechnique]
+    ] == [stage.techniques for stage, _ in stages]
+    assert all(chunk_safe for _, chunk_safe in stages)
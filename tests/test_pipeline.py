@@ -0,0 +1,56 @@
+import pathlib
+
+from obfuscator import Obfuscator, ctools, examples
+from obfuscator.cache import ObfuscationCache
+from obfuscator.pipeline import PipelineExecutor
+from obfuscator.techniques import (
+    PassthroughTechnique,
+    RemoveSpacesTechnique,
+    ReplaceAdditionTechnique,
+    ReplaceSingleAdditionTechnique,
+    ReplaceXORTechnique,
+)
+
+CHAINS = {
+    "passthrough": [PassthroughTechnique],
+    "addition": [ReplaceAdditionTechnique],
+    "addition_xor": [ReplaceAdditionTechnique, ReplaceXORTechnique],
+    "addition_xor_spaces": [
+        ReplaceAdditionTechnique,
+        ReplaceXORTechnique,
+        RemoveSpacesTechnique,
+    ],
+    "single_addition": [ReplaceAdditionTechnique, ReplaceSingleAdditionTechnique],
+}
+
+
+def test_pipeline_shares_prefixes(c_file: pathlib.Path):
+    source = c_file.read_text()
+    executor = PipelineExecutor(CHAINS)
+    variants = executor.obfuscate(source)
+    assert 5 == executor.passes
+    for name, chain in CHAINS.items():
+        assert Obfuscator(chain).obfuscate(source) == variants[name]
+
+
+def test_pipeline_cache(c_file: pathlib.Path):
+    source = c_file.read_text()
+    cache = ObfuscationCache()
+    first = PipelineExecutor(CHAINS, cache)
+    second = PipelineExecutor(CHAINS, cache)
+    assert first.obfuscate(source) == second.obfuscate(source)
+    assert 0 == second.passes
+    assert 5 == cache.hits
+
+
+def test_pipeline_compile_and_run(tmp_path: pathlib.Path):
+    source = examples.available_examples()["sum42.c"]["path"].read_text()
+    executor = PipelineExecutor(CHAINS)
+    variants = executor.obfuscate(source)
+    runner = ctools.Runner(tmp_path)
+    results = executor.compile_and_run(variants, runner, 1, 2, 3)
+    assert {name: 137 for name in CHAINS} == results
+    # Passthrough variant identical to the original source: 4 builds
+    assert 4 == len(runner.compiled_modules)
+    again = executor.compile_and_run(variants, runner, 1, 2, 3, function_name="f")
+    assert results == again
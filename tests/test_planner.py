@@ -0,0 +1,81 @@
+import pathlib
+
+from obfuscator import ctools, planner
+from obfuscator.techniques import (
+    RemoveSpacesTechnique,
+    ReplaceAdditionTechnique,
+    ReplaceSingleAdditionTechnique,
+)
+
+HOT_AND_COLD = r"""#include <stdint.h>
+
+uint32_t hot(uint32_t n)
+{
+    uint32_t i, a, r;
+    a = 0;
+    for (i = 0; i < n; i++) {
+        a = a + i;
+    }
+    return a;
+}
+
+uint32_t cold(uint32_t a, uint32_t b)
+{
+    uint32_t c, r;
+    c = a + b;
+    return c;
+}
+"""
+
+
+def test_function_spans():
+    spans = planner.function_spans(HOT_AND_COLD)
+    assert ["hot", "cold"] == [name for name, _, _ in spans]
+    for _, start, end in spans:
+        assert HOT_AND_COLD[start:end].startswith("uint32_t")
+        assert HOT_AND_COLD[start:end].endswith("}")
+
+
+def test_loop_spans():
+    source = "for (i = 0; i < n; i++) { a = a + i; } b = a;"
+    loops = planner.loop_spans(source)
+    assert [(0, source.index("}") + 1)] == loops
+    assert planner.LOOP_WEIGHT == planner.loop_weight(source.index("a + i"), loops)
+    assert 1 == planner.loop_weight(source.index("b ="), loops)
+
+
+def test_plan_spares_hot_loops():
+    plans = planner.Planner(max_slowdown=2.0).plan(HOT_AND_COLD)
+    hot, cold = plans
+    assert ReplaceSingleAdditionTechnique not in hot.techniques
+    assert ReplaceAdditionTechnique in hot.techniques
+    assert ReplaceSingleAdditionTechnique in cold.techniques
+    for plan in plans:
+        assert plan.slowdown <= 2.0
+
+
+def test_plan_without_budget():
+    plans = planner.Planner(max_slowdown=1.0).plan(HOT_AND_COLD)
+    for plan in plans:
+        assert [RemoveSpacesTechnique] == plan.techniques
+        assert 1.0 == plan.slowdown
+
+
+def test_plan_growth_limit():
+    plans = planner.Planner(max_slowdown=float("inf"), max_growth=1.0).plan(
+        HOT_AND_COLD
+    )
+    for plan in plans:
+        assert RemoveSpacesTechnique in plan.techniques
+        assert plan.growth <= 1.0
+
+
+def test_planned_obfuscator(tmp_path: pathlib.Path):
+    obfuscator = planner.PlannedObfuscator(planner.Planner(max_slowdown=2.0))
+    obfuscated = obfuscator.obfuscate(HOT_AND_COLD)
+    assert obfuscated.startswith("#include <stdlib.h>\n#include <stdint.h>")
+    assert "rand" in obfuscated
+
+    runner = ctools.Runner(tmp_path)
+    runner.compile("planned", obfuscated, "uint32_t cold(uint32_t a, uint32_t b);")
+    assert 42 == runner.run("planned", "cold", 40, 2)
@@ -0,0 +1,123 @@
+import os
+import pathlib
+import signal
+
+from obfuscator import ctools, pool
+
+FAULTY_FUNCTIONS = r"""#include <stdint.h>
+
+uint32_t add(uint32_t a, uint32_t b)
+{
+    return a + b;
+}
+
+uint32_t crash(uint32_t a)
+{
+    volatile uint32_t *pointer = 0;
+    return *pointer + a;
+}
+
+uint32_t crash_buffer(uint8_t *buffer, uint32_t size)
+{
+    volatile uint8_t *pointer = 0;
+    return *pointer + buffer[size - 1];
+}
+
+uint32_t fill(uint8_t *buffer, uint32_t size)
+{
+    for (uint32_t i = 0; i < size; i++) {
+        buffer[i] = (uint8_t)(buffer[i] + i);
+    }
+    return buffer[size - 1];
+}
+
+uint32_t spin(uint32_t a)
+{
+    volatile uint32_t i = 0;
+    while (a) {
+        i++;
+    }
+    return i;
+}
+"""
+
+
+def test_pool_runs_functions(tmp_path: pathlib.Path):
+    with pool.ExecutionPool(workers=2) as execution_pool:
+        runner = ctools.Runner(tmp_path, pool=execution_pool)
+        assert 3 == runner.compile_and_run("pooled", FAULTY_FUNCTIONS, 1, 2)
+        assert 7 == runner.run("pooled", "add", 3, 4)
+        assert runner.run("pooled", "missing") is None
+        other_runner = ctools.Runner(tmp_path / "other", pool=execution_pool)
+        assert other_runner.compare_functions(FAULTY_FUNCTIONS, FAULTY_FUNCTIONS, 1, 1)
+
+
+def test_pool_isolates_crashes(tmp_path: pathlib.Path):
+    with pool.ExecutionPool(workers=1, timeout=0.5) as execution_pool:
+        runner = ctools.Runner(tmp_path, pool=execution_pool)
+        runner.compile_source("faulty", FAULTY_FUNCTIONS)
+        try:
+            runner.run("faulty", "crash", 1)
+            assert False
+        except pool.WorkerCrashError as error:
+            assert error.funcname == "crash"
+            assert error.exitcode < 0
+        try:
+            runner.run("faulty", "spin", 1)
+            assert False
+        except pool.CallTimeoutError as error:
+            assert error.timeout == 0.5
+        assert 2 == execution_pool.respawns
+        assert 5 == runner.run("faulty", "add", 2, 3)
+
+
+def test_pool_respawns_idle_dead_workers(tmp_path: pathlib.Path):
+    with pool.ExecutionPool(workers=1) as execution_pool:
+        runner = ctools.Runner(tmp_path, pool=execution_pool)
+        assert 3 == runner.compile_and_run("faulty", FAULTY_FUNCTIONS, 1, 2)
+        for _ in range(2):
+            worker = execution_pool._idle.queue[0]
+            os.kill(worker.process.pid, signal.SIGKILL)
+            worker.process.join()
+            assert 5 == runner.run("faulty", "add", 2, 3)
+        assert 2 == execution_pool.respawns
+
+
+def test_pool_reraises_call_errors(tmp_path: pathlib.Path):
+    with pool.ExecutionPool(workers=1) as execution_pool:
+        runner = ctools.Runner(tmp_path, pool=execution_pool)
+        runner.compile_source("faulty", FAULTY_FUNCTIONS)
+        try:
+            runner.run("faulty", "add", "not an int", 1)
+        except TypeError:
+            assert True
+            return
+        assert False
+
+
+def test_pool_shares_buffers(tmp_path: pathlib.Path):
+    with pool.ExecutionPool(workers=1) as execution_pool:
+        runner = ctools.Runner(tmp_path, pool=execution_pool)
+        runner.compile_source("buffers", FAULTY_FUNCTIONS)
+        buffer = bytearray(b"\x01" * 300)
+        assert 44 == runner.run("buffers", "fill", buffer, 300)
+        assert bytearray((1 + i) % 256 for i in range(300)) == buffer
+        # Read-only buffers are shared but not written back
+        data = bytes(8)
+        assert 7 == runner.run("buffers", "fill", data, 8)
+        assert bytes(8) == data
+        assert 0 == execution_pool.respawns
+
+
+def test_pool_isolates_buffer_crashes(tmp_path: pathlib.Path):
+    with pool.ExecutionPool(workers=1) as execution_pool:
+        runner = ctools.Runner(tmp_path, pool=execution_pool)
+        runner.compile_source("buffers", FAULTY_FUNCTIONS)
+        buffer = bytearray(16)
+        try:
+            runner.run("buffers", "crash_buffer", buffer, 16)
+            assert False
+        except pool.WorkerCrashError as error:
+            assert error.funcname == "crash_buffer"
+        assert bytearray(16) == buffer
+        assert 1 == execution_pool.respawns
@@ -0,0 +1,106 @@
+import pathlib
+import time
+
+import pytest
+
+from obfuscator.editbuffer import EditBuffer
+from obfuscator.sourceindex import SourceIndex
+from obfuscator.techniques import (
+    ReplaceAdditionChainTechnique,
+    ReplaceAdditionTechnique,
+    ReplaceSingleAdditionTechnique,
+    ReplaceXORTechnique,
+)
+
+SOURCE = """int f(int a, int b)
+{
+    int c;
+    c = a + b + 1;
+    for (c = 0; c < b; c++) { a = a ^ c; }
+    return c;
+}
+"""
+
+
+def test_count_and_lines():
+    index = SourceIndex(SOURCE)
+    assert 4 == index.count("+")
+    assert 1 == index.count("++")
+    assert 1 == index.count("^")
+    assert 0 == index.count("^=")
+    assert 1 == index.line(0)
+    assert 4 == index.line(SOURCE.index("a + b"))
+    assert 8 == index.line(len(SOURCE))
+
+
+def region_of(text: str):
+    start = SOURCE.index(text)
+    return start, start + len(text)
+
+
+def test_regions():
+    index = SourceIndex(SOURCE)
+    assert [] == index.regions("|")
+    assert [region_of(" a = a ^ c;")] == index.regions("^")
+    assert [
+        region_of("\n    c = a + b + 1;"),
+        region_of(" c++) { a = a ^ c;"),
+    ] == index.regions("+^")
+    statement = region_of("c = a + b")
+    assert [statement] == index.regions("+", *statement)
+
+
+@pytest.mark.parametrize(
+    "technique",
+    [
+        ReplaceAdditionTechnique,
+        ReplaceAdditionChainTechnique,
+        ReplaceSingleAdditionTechnique,
+        ReplaceXORTechnique,
+    ],
+)
+def test_narrowed_matches(technique, c_file: pathlib.Path):
+    for source in (SOURCE, c_file.read_text()):
+        index = SourceIndex(source)
+        expected = [match.span() for match in technique.matches(source)]
+        assert expected == [
+            match.span() for match in technique.matches(source, 0, None, index)
+        ]
+
+
+def test_skipped_pass_inserts_no_lib():
+    buffer = EditBuffer("int f(int a) { return a - 1; }")
+    assert 0 == ReplaceSingleAdditionTechnique.edit(buffer)
+    assert 0 == ReplaceXORTechnique.edit(buffer)
+    assert "#include" not in buffer.text()
+    assert buffer.index() is buffer.index()
+
+
+def dense_source(statements: int) -> str:
+    return "int f(int a, int b)\n{\n" + "    a = a + b;\n" * statements + "}\n"
+
+
+def test_regions_dense_triggers():
+    source = dense_source(100)
+    index = SourceIndex(source)
+    assert [(0, len(source))] == index.regions("+", max_density=0.25)
+    assert [] == index.regions("^", max_density=0.25)
+    sparse = source.replace("+", "-", 99)
+    start = sparse.rindex("\n    a = a + b;")
+    assert [(start, start + len("\n    a = a + b;"))] == SourceIndex(sparse).regions(
+        "+", max_density=0.25
+    )
+
+
+def test_regions_scale_linearly():
+    def best_time(statements: int) -> float:
+        index = SourceIndex(dense_source(statements))
+        durations = []
+        for _ in range(3):
+            start = time.perf_counter()
+            index.regions("+")
+            durations.append(time.perf_counter() - start)
+        return min(durations)
+
+    # Linear: x4, quadratic: x16
+    assert best_time(80000) < 8 * best_time(20000)
@@ -1,9 +1,13 @@
 import pathlib
+import re
 
+from obfuscator.editbuffer import EditBuffer
 from obfuscator.techniques import (
     PassthroughTechnique,
     RemoveSpacesTechnique,
+    ReplaceAdditionChainTechnique,
     ReplaceAdditionTechnique,
+    ReplaceSingleAdditionConstantTechnique,
     ReplaceSingleAdditionTechnique,
     ReplaceXORTechnique,
     ReplacingTechnique,
@@ -38,6 +42,49 @@ def test_replace_single_addition_technique():
     assert ReplaceSingleAdditionTechnique.apply(test) == expected
 
 
+def test_replace_single_addition_constant_technique():
+    test = "res = a + b;"
+    obfuscated = ReplaceSingleAdditionConstantTechnique.apply(test)
+    assert re.fullmatch(
+        r"res = a \+ (0x[0-9a-f]{4}); res = res \+ b; res = res - \1;", obfuscated
+    )
+    assert obfuscated == ReplaceSingleAdditionConstantTechnique.apply(test)
+    other_seed = EditBuffer(test, seed=1)
+    ReplaceSingleAdditionConstantTechnique.edit(other_seed)
+    assert len(obfuscated) == len(other_seed.text())
+    assert obfuscated != other_seed.text()
+
+
+def test_replace_single_addition_constant_target_operand():
+    technique = ReplaceSingleAdditionConstantTechnique
+    assert re.fullmatch(
+        r"x = x \+ (0x[0-9a-f]{4}); x = x \+ y; x = x - \1;",
+        technique.apply("x = y + x;"),
+    )
+    assert re.fullmatch(
+        r"x = x \+ (0x[0-9a-f]{4}); x = x \+ y; x = x - \1;",
+        technique.apply("x = x + y;"),
+    )
+    constant, double = re.fullmatch(
+        r"x = x - (0x[0-9a-f]{4}); x = x \+ x; x = x \+ (0x[0-9a-f]{4});",
+        technique.apply("x = x + x;"),
+    ).groups()
+    assert 2 * int(constant, 16) == int(double, 16)
+
+
+def test_replace_single_addition_constant_occurrences():
+    function = "int {name}(int a, int b)\n{{\n    a = a + b;\n    a = a + b;\n}}\n"
+    source = function.format(name="f") + function.format(name="g")
+    constants = re.findall(
+        r"a = a \+ (0x[0-9a-f]{4}); a = a \+ b;",
+        ReplaceSingleAdditionConstantTechnique.apply(source),
+    )
+    assert 4 == len(set(constants))
+    # Independent of the position of the function
+    moved = ReplaceSingleAdditionConstantTechnique.apply("int x;\n" + source)
+    assert constants == re.findall(r"a = a \+ (0x[0-9a-f]{4}); a = a \+ b;", moved)
+
+
 def test_replace_xor_technique():
     test = r"res = a ^ b;"
     expected = r"res = (~a & b) | (a & ~b);"
@@ -47,3 +94,11 @@ def test_replace_xor_technique():
 def test_not_implemented_replacement_property():
     assert NotImplementedError == ReplacingTechnique.PATTERN
     assert NotImplementedError == ReplacingTechnique.REPLACEMENT
+
+
+def test_replace_addition_chain_technique():
+    test = "res = a + b + c + 42;"
+    expected = "res = (-(-(-(-a + (-b))) + (-(c + 42))));"
+    assert ReplaceAdditionChainTechnique.apply(test) == expected
+    match = next(ReplaceAdditionChainTechnique.matches(test))
+    assert 2 == ReplaceAdditionChainTechnique.substitutions(match)